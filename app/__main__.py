@@ -0,0 +1,221 @@
+"""
+Command line interface for the stats engine (without the streamlit UI).
+
+Run from the repo root, e.g.:
+
+    GH_TOKENS=<token> python -m app stats jrieke --year 2021
+    GH_TOKENS=<token> python -m app stats jrieke --periods 2021 2021-06-01..2021-08-31
+
+Logs and progress go to stderr, results are printed to stdout as JSON. API traffic
+can be recorded to a cassette and replayed later without network access:
+
+    python -m app --record jrieke.jsonl.gz stats jrieke
+    python -m app --replay jrieke.jsonl.gz --latency-scale 0 stats jrieke
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+
+# Modules in app/ import each other as top-level modules (that's how streamlit runs
+# main.py), so make them importable when running as a package.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import batch  # noqa: E402
+import github_reader  # noqa: E402
+import server  # noqa: E402
+from cache import PersistentCache  # noqa: E402
+from cassette import Cassette  # noqa: E402
+from stargazer_index import StargazerIndex  # noqa: E402
+
+
+# Year of the stats (see `github_reader.stats_year`).
+YEAR_ARGUMENT = dict(
+    type=int,
+    help="year of the stats, needs to overlap with --periods (default: year of the "
+    "first period or 2021)",
+)
+
+# Periods to count new stars in, e.g. `--periods 2021 2020 2021-03-01..2021-06-30`.
+PERIODS_ARGUMENT = dict(
+    nargs="+",
+    type=github_reader.parse_period,
+    metavar="PERIOD",
+    help="count new stars in these years or date ranges (start..end) instead of "
+    "--year, all from the same scan",
+)
+
+# How new stars are counted (see `github_reader.STARS_MODE`).
+MODE_ARGUMENT = dict(
+    choices=["exact", "approximate", "refine"],
+    help="count new stars exactly, estimate them from a few sampled pages per repo "
+    "or estimate first and refine (default: STARS_MODE or exact)",
+)
+
+# Maximum API calls per user (see `github_reader.USER_API_BUDGET`).
+BUDGET_ARGUMENT = dict(
+    type=int,
+    help="maximum API calls to count the new stars of a user, likely-hot repos "
+    "first (default: USER_API_BUDGET or no limit)",
+)
+
+
+def stats(args: argparse.Namespace) -> int:
+    """Computes the stats for one user and prints them as JSON."""
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            stats_maker = github_reader.StatsMaker(
+                args.username, args.year, periods=args.periods
+            )
+        except github_reader.UserNotFoundError as e:
+            print(e)
+            return 1
+        if args.all_external:
+            include_external = stats_maker.external_repos
+        else:
+            include_external = args.external
+        for stats, progress, msg in stats_maker.stream(
+            include_external,
+            max_workers=args.max_workers,
+            mode=args.mode,
+            budget=args.budget,
+        ):
+            print(f"[{progress:.0%}] {msg}")
+    print(json.dumps(stats))
+    return 0
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    """Computes the stats for all users in a file and writes them as JSONL."""
+    with contextlib.redirect_stdout(sys.stderr):
+        report = batch.run(
+            batch.read_usernames(args.usernames),
+            args.output,
+            args.year,
+            periods=args.periods,
+            mode=args.mode,
+            budget=args.budget,
+            all_external=not args.own_repos_only,
+            concurrency=args.concurrency,
+            max_workers=args.max_workers,
+        )
+    print(json.dumps(report))
+    return 0 if report["failed"] == 0 else 1
+
+
+def serve(args: argparse.Namespace) -> int:
+    """Runs the HTTP API."""
+    server.serve(args.host, args.port)
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app", description=__doc__)
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument(
+        "--record", metavar="CASSETTE", help="record all API traffic to a file"
+    )
+    cassette_group.add_argument(
+        "--replay", metavar="CASSETTE", help="replay API traffic from a file"
+    )
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="factor for the recorded latency when replaying (0 = no latency)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_stats = subparsers.add_parser("stats", help="compute stats for one user")
+    parser_stats.add_argument("username", help="Github user or org name")
+    parser_stats.add_argument("--year", **YEAR_ARGUMENT)
+    parser_stats.add_argument("--periods", **PERIODS_ARGUMENT)
+    parser_stats.add_argument("--mode", **MODE_ARGUMENT)
+    parser_stats.add_argument("--budget", **BUDGET_ARGUMENT)
+    parser_stats.add_argument(
+        "--external",
+        nargs="*",
+        default=[],
+        metavar="REPO",
+        help="external repos to include (owner/name)",
+    )
+    parser_stats.add_argument(
+        "--all-external",
+        action="store_true",
+        help="include all external repos the user contributed to",
+    )
+    parser_stats.add_argument(
+        "--max-workers", type=int, help="number of repos to query in parallel"
+    )
+    parser_stats.set_defaults(func=stats)
+
+    parser_batch = subparsers.add_parser(
+        "batch",
+        help="compute stats for many users",
+        description=batch.__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser_batch.add_argument("usernames", help="file with one username per line")
+    parser_batch.add_argument(
+        "-o", "--output", required=True, help="JSONL file for results (resumable)"
+    )
+    parser_batch.add_argument("--year", **YEAR_ARGUMENT)
+    parser_batch.add_argument("--periods", **PERIODS_ARGUMENT)
+    parser_batch.add_argument("--mode", **MODE_ARGUMENT)
+    parser_batch.add_argument("--budget", **BUDGET_ARGUMENT)
+    parser_batch.add_argument(
+        "--own-repos-only",
+        action="store_true",
+        help="don't count the stars of external repos",
+    )
+    parser_batch.add_argument(
+        "--concurrency", type=int, default=4, help="number of users in parallel"
+    )
+    parser_batch.add_argument(
+        "--max-workers", type=int, help="number of repos per user in parallel"
+    )
+    parser_batch.set_defaults(func=run_batch)
+
+    parser_serve = subparsers.add_parser(
+        "serve",
+        help="run the JSON/SSE HTTP API",
+        description=server.__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser_serve.add_argument("--host", default="127.0.0.1")
+    parser_serve.add_argument("--port", type=int, default=8000)
+    parser_serve.set_defaults(func=serve)
+
+    args = parser.parse_args(argv)
+    if args.command in ("stats", "batch"):
+        try:
+            args.year = github_reader.stats_year(args.year, args.periods)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.record or args.replay:
+        cassette = Cassette(
+            args.record or args.replay,
+            mode="record" if args.record else "replay",
+            latency_scale=args.latency_scale,
+        )
+        # Start with empty caches, so the cassette contains (and replay sends) all
+        # requests that are needed to compute the stats.
+        # Logs go to stderr, so stdout only contains the results.
+        cache_dir = tempfile.mkdtemp()
+        with contextlib.redirect_stdout(sys.stderr):
+            github_reader.configure(
+                client=github_reader.make_client(cassette),
+                persistent_cache=PersistentCache(cache_dir),
+                stargazer_index=StargazerIndex(cache_dir),
+            )
+    try:
+        return args.func(args)
+    finally:
+        github_reader.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
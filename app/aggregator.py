@@ -0,0 +1,54 @@
+"""
+Incremental aggregation of new stars per repo.
+
+`StatsMaker.stream` yields intermediate stats after every repo. Instead of summing all
+repos and searching the hottest one again each time, the aggregator keeps a running
+total and a max-heap of repos, so each update costs O(log n).
+"""
+
+import heapq
+from typing import Union
+
+
+class StarsAggregator:
+    def __init__(self):
+        """Running total and hottest repo of the new stars of several repos."""
+        self.total = 0
+        self._stars = {}  # maps repo to its current number of new stars
+        self._order = {}  # maps repo to its position (breaks ties like `max`)
+        self._heap = []  # entries (-stars, position, repo), outdated ones are skipped
+        self._first = None  # repo with the lowest position
+
+    def __len__(self) -> int:
+        return len(self._stars)
+
+    def set(self, repo: str, position: int, new_stars: Union[int, None]) -> None:
+        """
+        Sets the new stars of a repo. `position` is the repo's place in the list of
+        all repos, on ties the repo with the lowest position is the hottest. Repos
+        with `new_stars=None` (not counted yet) are ignored.
+        """
+        if new_stars is None:
+            return
+        self.total += new_stars - self._stars.get(repo, 0)
+        self._stars[repo] = new_stars
+        self._order[repo] = position
+        heapq.heappush(self._heap, (-new_stars, position, repo))
+        if self._first is None or position < self._order[self._first]:
+            self._first = repo
+
+    def hottest(self) -> Union[str, None]:
+        """Returns the repo with the most new stars (or None if there are no repos)."""
+        while self._heap:
+            neg_stars, position, repo = self._heap[0]
+            if self._stars.get(repo) == -neg_stars and self._order[repo] == position:
+                return repo
+            heapq.heappop(self._heap)  # outdated entry
+        return None
+
+    def first(self) -> Union[str, None]:
+        """Returns the repo with the lowest position (or None if there are no repos)."""
+        return self._first
+
+    def get(self, repo: str) -> Union[int, None]:
+        return self._stars.get(repo)
@@ -0,0 +1,215 @@
+"""
+Batch mode: computes the stats for a list of users (e.g. all members of an org).
+
+Users are processed by a bounded pool of threads, each of which runs `StatsMaker`
+like the app does. Repos shared by several users (e.g. the org's repos) are only
+queried once per run. Every result is appended to a JSONL file as soon as it's
+done, so an interrupted run can be resumed: users that already have a result in the
+output file are skipped.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List
+
+import github_client
+import github_reader
+
+
+class RunMemo:
+    def __init__(self):
+        """In-memory memoization for the duration of a batch run (thread-safe)."""
+        self.hits = 0
+        self.misses = 0
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, func: Callable) -> Callable:
+        """Decorator that memoizes `func` by its arguments."""
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = (func.__name__, args)
+            with self._lock:
+                if key in self._results:
+                    self.hits += 1
+                    return self._results[key]
+                self.misses += 1
+            # Concurrent misses for the same key are coalesced by the single-flight
+            # inside `func`, so they don't query the API twice.
+            result = func(*args)
+            with self._lock:
+                self._results[key] = result
+            return result
+
+        return wrapper
+
+
+def read_usernames(path: str) -> List[str]:
+    """Reads usernames from a file (one per line, `#` starts a comment)."""
+    usernames = []
+    with open(path) as f:
+        for line in f:
+            username = line.split("#")[0].strip()
+            if username and username not in usernames:
+                usernames.append(username)
+    return usernames
+
+
+def read_checkpoint(path: str) -> set:
+    """
+    Returns the usernames that already have a result in the JSONL file `path`. An
+    incomplete last line (from a run that was killed while writing) is removed.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r+") as f:
+        complete = 0  # length of the file up to the last complete line
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            done.add(json.loads(line)["username"])
+            complete += len(line.encode())
+        f.truncate(complete)
+    return done
+
+
+def _api_calls() -> int:
+    """Returns the number of API requests made by this process so far."""
+    return sum(usage["used"] for usage in github_reader.token_usage())
+
+
+def _revalidated() -> int:
+    """
+    Returns the number of API requests answered with 304 Not Modified so far (they
+    don't count against the rate limit, see `http_cache.py`).
+    """
+    http_cache = github_reader.get_client().http_cache
+    return http_cache.revalidated if http_cache is not None else 0
+
+
+def compute_stats(
+    username: str,
+    year: int,
+    periods: List[github_reader.Period] = None,
+    mode: str = None,
+    budget: int = None,
+    all_external: bool = True,
+    max_workers: int = None,
+) -> Dict:
+    """Runs `StatsMaker` for one user and returns its final stats."""
+    stats_maker = github_reader.StatsMaker(username, year, periods=periods)
+    include_external = stats_maker.external_repos if all_external else []
+    for stats, _, _ in stats_maker.stream(
+        include_external, max_workers=max_workers, mode=mode, budget=budget
+    ):
+        pass
+    return stats
+
+
+def run(
+    usernames: Iterable[str],
+    output: str,
+    year: int,
+    periods: List[github_reader.Period] = None,
+    mode: str = None,
+    budget: int = None,
+    all_external: bool = True,
+    concurrency: int = 4,
+    max_workers: int = None,
+) -> Dict:
+    """
+    Computes the stats for all users and appends them to a JSONL file.
+
+    Each line of the output contains the username, the year and either the stats or
+    an error (if the user doesn't exist). Users that fail for other reasons (e.g.
+    timeouts, exhausted rate limits or unexpected API responses) aren't written, so
+    they're retried when the run is resumed.
+
+    Args:
+        usernames (iterable): Github user or org names.
+        output (str): Path of the JSONL file. Users already in it are skipped.
+        year (int): Year to compute the stats for.
+        periods (list of Period, optional): Periods to count new stars in (see
+            `github_reader.StatsMaker`). Defaults to `None`, i.e. only `year`.
+        mode (str, optional): How new stars are counted, "exact", "approximate"
+            (bounded API calls per repo) or "refine". Defaults to `None`, in which
+            case `github_reader.STARS_MODE` is used.
+        budget (int, optional): Maximum number of API calls per user. Defaults to
+            `None`, in which case `github_reader.USER_API_BUDGET` is used.
+        all_external (bool, optional): Whether to count the stars of all external
+            repos a user contributed to. Defaults to True.
+        concurrency (int, optional): Number of users processed at the same time.
+            Defaults to 4.
+        max_workers (int, optional): Number of repos queried in parallel for each
+            user. Defaults to `None`, in which case `github_reader.MAX_WORKERS` is
+            used.
+
+    Returns:
+        dict: Throughput report of this run.
+    """
+    done = read_checkpoint(output)
+    todo = [username for username in usernames if username not in done]
+    print(f"{len(done)} users already done, {len(todo)} to go")
+
+    memo = RunMemo()
+    github_reader.configure(memoize=memo)
+    num_done = num_failed = 0
+    start_time = time.time()
+    start_calls = _api_calls()
+    start_revalidated = _revalidated()
+
+    with open(output, "a") as f, ThreadPoolExecutor(max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(
+                compute_stats,
+                username,
+                year,
+                periods,
+                mode,
+                budget,
+                all_external,
+                max_workers,
+            ): username
+            for username in todo
+        }
+        for future in as_completed(futures):
+            username = futures[future]
+            result = {"username": username, "year": year}
+            try:
+                result["stats"] = future.result()
+            except github_reader.UserNotFoundError as e:
+                result["error"] = str(e)
+            except Exception as e:
+                # Only this user fails (it's retried when the run is resumed), the
+                # others continue. Unexpected errors also print their traceback.
+                print(f"Failed: {username} ({e})")
+                if not isinstance(e, (github_client.GithubError, RuntimeError)):
+                    traceback.print_exc()
+                num_failed += 1
+                continue
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            num_done += 1
+            print(f"Done: {username} ({num_done}/{len(todo)})")
+
+    elapsed = time.time() - start_time
+    calls = _api_calls() - start_calls
+    report = {
+        "users": num_done,
+        "failed": num_failed,
+        "skipped": len(done),
+        "seconds": round(elapsed, 2),
+        "users_per_minute": round(60 * num_done / elapsed, 1) if elapsed else 0.0,
+        "api_calls": calls,
+        "api_calls_per_user": round(calls / num_done, 1) if num_done else 0.0,
+        "revalidated_calls": _revalidated() - start_revalidated,
+        "shared_queries": memo.hits,
+    }
+    return report
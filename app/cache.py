@@ -0,0 +1,143 @@
+"""
+Persistent cache for expensive API queries, stored in SQLite.
+
+In contrast to streamlit's `st.cache`, results survive restarts and are shared
+between all processes that use the same cache directory (the database runs in WAL
+mode, so readers don't block writers). Entries have a TTL and the least recently
+used ones are evicted once the cache holds more than `max_entries`.
+"""
+
+import functools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple, Union
+
+import metrics
+
+
+class SQLiteStore:
+    # Statements that create the tables, run once when the store is opened.
+    SCHEMA = []
+
+    def __init__(self, path: str):
+        """Base class for data stored in a SQLite database at `path` (in WAL mode)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._local = threading.local()  # sqlite connections can't be shared
+        for statement in self.SCHEMA:
+            self._connect().execute(statement)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Returns the database connection for the current thread."""
+        if not hasattr(self._local, "conn"):
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return self._local.conn
+
+
+class PersistentCache(SQLiteStore):
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, "
+        "expires REAL, accessed REAL)"
+    ]
+
+    def __init__(self, directory: str, max_entries: int = 100000):
+        """
+        Persistent cache in `directory/cache.sqlite`.
+
+        Args:
+            directory (str): Directory for the database (created if needed).
+            max_entries (int, optional): Maximum number of entries. Defaults to
+                100000.
+        """
+        super().__init__(os.path.join(directory, "cache.sqlite"))
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._sets = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Returns `(True, value)` if `key` is cached, else `(False, None)`."""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value FROM entries "
+            "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, now),
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+        conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return True, pickle.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Union[float, None] = None) -> None:
+        """Stores `value` under `key`. If `ttl` is None, the entry never expires."""
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+            (key, pickle.dumps(value), expires, now),
+        )
+        with self._lock:
+            self._sets += 1
+            evict = self._sets % 100 == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """Removes expired entries and the least recently used ones above the limit."""
+        conn = self._connect()
+        conn.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+            "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> Dict:
+        """Returns hit/miss counters (of this process) and the number of entries."""
+        (entries,) = self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "entries": entries,
+        }
+
+    def memoize(
+        self, ttl: Callable[..., Union[float, None]], version: int = 1
+    ) -> Callable:
+        """
+        Decorator that caches the results of a function, keyed by its name and
+        arguments. `ttl` is called with the same arguments and returns the TTL of
+        the entry in seconds (or None to keep it forever). Bump `version` when the
+        format of the return value changes, so old entries aren't used any more.
+        """
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                key = repr((func.__name__, version, args))
+                hit, value = self.get(key)
+                metrics.annotate(cache="hit" if hit else "miss")
+                if hit:
+                    print(f"Persistent cache hit: {func.__name__}{args}")
+                    return value
+                value = func(*args)
+                self.set(key, value, ttl(*args))
+                return value
+
+            return wrapper
+
+        return decorator
@@ -0,0 +1,136 @@
+"""
+Records API traffic to a cassette on disk and replays it without network access.
+
+In record mode, every REST and GraphQL response the client receives is appended to
+the cassette, together with the request (method, path relative to the API's base
+URL, params and body, but never the token), the response headers and the time it
+took. Cassettes are gzipped JSON lines, so even large accounts stay small.
+
+In replay mode, requests are answered from the cassette. Identical requests are
+answered in the order they were recorded (e.g. repeated polls of contributor stats
+that returned 202 first). The original latency of each response is reproduced,
+scaled by `latency_scale` (0 replays as fast as possible).
+"""
+
+import asyncio
+import gzip
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Tuple
+
+from multidict import CIMultiDict
+
+from github_client import GithubError, Response
+
+
+# Format version of cassettes, stored in the first line.
+VERSION = 1
+
+
+class CassetteMissError(GithubError):
+    """Raised in replay mode for a request that isn't in the cassette."""
+
+
+def _key(method: str, path: str, params: Dict, body: Dict) -> str:
+    return json.dumps([method, path, params or {}, body], sort_keys=True)
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str = "replay", latency_scale: float = 1.0):
+        """
+        Cassette at `path` (a `.jsonl.gz` file).
+
+        Args:
+            path (str): Path of the cassette.
+            mode (str, optional): "record" (overwrites the file) or "replay".
+                Defaults to "replay".
+            latency_scale (float, optional): Factor for the recorded latency in
+                replay mode. Defaults to 1.0.
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.interactions = 0
+        self._lock = threading.Lock()
+        if mode == "record":
+            self._start = time.time()
+            self._file = gzip.open(path, "wt")
+            self._write({"version": VERSION, "created": self._start})
+        else:
+            self._recorded = defaultdict(deque)  # maps request key to interactions
+            with gzip.open(path, "rt") as f:
+                header = json.loads(next(f))
+                if header.get("version") != VERSION:
+                    raise ValueError(f"Unsupported cassette version: {path}")
+                for line in f:
+                    interaction = json.loads(line)
+                    key = _key(
+                        interaction["method"],
+                        interaction["path"],
+                        interaction["params"],
+                        interaction["json"],
+                    )
+                    self._recorded[key].append(interaction)
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _write(self, record: Dict) -> None:
+        with self._lock:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+
+    def record(
+        self,
+        method: str,
+        path: str,
+        params: Dict,
+        body: Dict,
+        response: Response,
+        elapsed: float,
+    ) -> None:
+        """Appends a request and its response to the cassette."""
+        self._write(
+            {
+                "t": round(time.time() - self._start, 4),
+                "method": method,
+                "path": path,
+                "params": params or {},
+                "json": body,
+                "status": response.status,
+                "headers": dict(response.headers),
+                "data": response.data,
+                "elapsed": round(elapsed, 4),
+            }
+        )
+        self.interactions += 1
+
+    async def replay(
+        self, method: str, path: str, params: Dict, body: Dict
+    ) -> Tuple[Response, int]:
+        """
+        Returns the recorded response for a request (and the size of its body) after
+        the recorded latency. Raises `CassetteMissError` if there's none.
+        """
+        recorded = self._recorded.get(_key(method, path, params, body))
+        if not recorded:
+            message = f"No response recorded for {method} {path} {params}"
+            raise CassetteMissError(message)
+        # Use the recorded responses in order and keep repeating the last one.
+        interaction = recorded.popleft() if len(recorded) > 1 else recorded[0]
+        self.interactions += 1
+        await asyncio.sleep(interaction["elapsed"] * self.latency_scale)
+        headers = CIMultiDict(interaction["headers"])
+        response = Response(interaction["status"], headers, interaction["data"])
+        size = len(json.dumps(interaction["data"])) if interaction["data"] else 0
+        return response, size
+
+    def close(self) -> None:
+        if self.mode == "record":
+            with self._lock:
+                self._file.close()
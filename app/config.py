@@ -0,0 +1,26 @@
+"""
+Configuration of the stats engine.
+
+Values are read from environment variables first. If streamlit is already loaded
+(i.e. we're running inside the app), streamlit's secrets are used as a fallback.
+Streamlit is never imported here, so scripts and workers that configure everything
+through environment variables don't pay for its import.
+"""
+
+import os
+import sys
+from typing import Any
+
+
+def get(name: str, default: Any = None) -> Any:
+    """Returns the config value `name` (from env variables or streamlit secrets)."""
+    if name in os.environ:
+        return os.environ[name]
+    if "streamlit" in sys.modules:
+        secrets = sys.modules["streamlit"].secrets
+        try:
+            if name in secrets:
+                return secrets[name]
+        except FileNotFoundError:  # no secrets.toml
+            pass
+    return default
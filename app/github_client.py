@@ -0,0 +1,456 @@
+"""
+Async client for the Github REST API (v3) and GraphQL API (v4).
+
+All requests go through one pooled aiohttp session, which keeps HTTP/1.1 connections
+alive between requests. `GithubClient` is a sync facade that runs the async client on
+an event loop in a background thread, so it can be used from streamlit's script
+thread and from worker threads alike. Pass `base_url` and `graphql_url` to run
+against a local stub server instead of api.github.com.
+"""
+
+import asyncio
+import re
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, List, Tuple
+
+import aiohttp
+from multidict import CIMultiDict
+
+import metrics
+from singleflight import AsyncSingleFlight
+from star_search import Page
+from tokens import NoTokenAvailableError, TokenScheduler, mask
+
+
+API_URL = "https://api.github.com"
+
+# Raw response: HTTP status, response headers (case-insensitive) and parsed JSON body
+# (or None).
+Response = namedtuple("Response", ["status", "headers", "data"])
+
+
+class GithubError(Exception):
+    def __init__(self, message: str, status: int = None, headers: Dict = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class NotFoundError(GithubError):
+    pass
+
+
+class ForbiddenError(GithubError):
+    """Raised on 403/429 responses, i.e. mostly when the rate limit is reached."""
+
+    pass
+
+
+class RequestTimeoutError(GithubError):
+    """Raised if a request times out or the connection fails."""
+
+    pass
+
+
+class ClientClosedError(GithubError):
+    """Raised for requests on a client that was already closed."""
+
+    pass
+
+
+def _endpoint(url: str, base_url: str) -> str:
+    """Returns the path of a REST API URL with names replaced, e.g. `/repos/:repo`."""
+    path = url[len(base_url) :] if url.startswith(base_url) else url
+    path = re.sub(r"^/(users|orgs)/[^/]+", r"/\1/:name", path)
+    return re.sub(r"^/repos/[^/]+/[^/]+", "/repos/:repo", path)
+
+
+def last_page(headers: Dict) -> int:
+    """Returns the number of the last page from the `Link` header (0 if not paged)."""
+    match = re.search(r'[?&]page=(\d+)[^>]*>; rel="last"', headers.get("Link", ""))
+    return int(match.group(1)) if match else 0
+
+
+class AsyncGithubClient:
+    def __init__(
+        self,
+        tokens: List[str],
+        base_url: str = API_URL,
+        graphql_url: str = None,
+        timeout: float = 15,
+        max_connections: int = 100,
+        cassette=None,
+        http_cache=None,
+    ):
+        """
+        Async client for the Github API.
+
+        Args:
+            tokens (list): API tokens. Each request uses the token with the most
+                remaining quota (see `tokens.TokenScheduler`).
+            base_url (str, optional): URL of the REST API. Defaults to `API_URL`.
+            graphql_url (str, optional): URL of the GraphQL API. Defaults to `None`,
+                in which case `base_url + "/graphql"` is used.
+            timeout (float, optional): Default timeout for each request in seconds.
+                Defaults to 15.
+            max_connections (int, optional): Size of the connection pool. Defaults
+                to 100.
+            cassette (Cassette, optional): Records all responses or replays them
+                instead of sending requests (see `cassette.py`). Defaults to None.
+            http_cache (HTTPCache, optional): Stores responses with validators and
+                revalidates them with conditional requests (see `http_cache.py`).
+                Defaults to None.
+        """
+        self.scheduler = TokenScheduler(tokens)
+        self.base_url = base_url.rstrip("/")
+        self.graphql_url = graphql_url or self.base_url + "/graphql"
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._session = None
+        self._inflight = AsyncSingleFlight()
+        self.cassette = cassette
+        self.http_cache = http_cache
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Returns the shared session (needs to be created on the event loop)."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections, keepalive_timeout=30
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Accept": "application/vnd.github.v3+json"},
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+        if self.cassette is not None:
+            self.cassette.close()
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Dict = None,
+        json: Dict = None,
+        headers: Dict = None,
+        timeout: float = None,
+        token: str = None,
+    ) -> Response:
+        """
+        Sends a request and returns the response. Raises a subclass of `GithubError`
+        for error responses, timeouts and connection problems.
+
+        The token is picked by the scheduler, unless it's passed explicitly.
+        Identical GET requests that are in flight at the same time are only sent
+        once and share the response (so don't mutate its data).
+        """
+        if not url.startswith("http"):
+            url = self.base_url + url
+        if method != "GET" or token is not None:
+            return await self._send(method, url, params, json, headers, timeout, token)
+        key = (
+            url,
+            tuple(sorted((params or {}).items())),
+            tuple(sorted((headers or {}).items())),
+        )
+        return await self._inflight.do(
+            key, lambda: self._send(method, url, params, json, headers, timeout, token)
+        )
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        params: Dict,
+        json: Dict,
+        headers: Dict,
+        timeout: float,
+        token: str,
+    ) -> Response:
+        """Sends a request (see `request`)."""
+        resource = "graphql" if url == self.graphql_url else "core"
+        if resource == "graphql":
+            endpoint = "/graphql"
+        else:
+            endpoint = _endpoint(url, self.base_url)
+        with metrics.span("http", method=method, endpoint=endpoint) as span:
+            if token is None:
+                try:
+                    token = self.scheduler.acquire(resource)
+                except NoTokenAvailableError as e:
+                    raise ForbiddenError(str(e), 403)
+            if token is not None:
+                span.labels["token"] = mask(token)
+
+            # Cassettes store paths, so they can be replayed against another URL.
+            path = url[len(self.base_url) :] if url.startswith(self.base_url) else url
+            if self.cassette is not None and self.cassette.replaying:
+                response, size = await self.cassette.replay(method, path, params, json)
+            else:
+                start = time.perf_counter()
+                response, size = await self._revalidate(
+                    method, url, path, params, json, headers, timeout, token
+                )
+                elapsed = time.perf_counter() - start
+                if self.cassette is not None:
+                    self.cassette.record(method, path, params, json, response, elapsed)
+            span.labels["status"] = response.status
+            span.bytes = size
+            span.info["url"] = url
+
+        self.scheduler.update(token, resource, response.headers)
+        if response.status >= 400:
+            if "Retry-After" in response.headers:  # secondary rate limit
+                self.scheduler.park(
+                    token, resource, float(response.headers["Retry-After"])
+                )
+            message = f"HTTP {response.status} for {method} {url}"
+            if isinstance(response.data, dict) and "message" in response.data:
+                message += f": {response.data['message']}"
+            if response.status == 404:
+                error_cls = NotFoundError
+            elif response.status in (403, 429):
+                error_cls = ForbiddenError
+            else:
+                error_cls = GithubError
+            raise error_cls(message, response.status, response.headers)
+        return response
+
+    async def _revalidate(
+        self,
+        method: str,
+        url: str,
+        path: str,
+        params: Dict,
+        json: Dict,
+        headers: Dict,
+        timeout: float,
+        token: str,
+    ) -> Tuple[Response, int]:
+        """
+        Sends a request through the HTTP cache (if there is one): If a response for
+        the same request is stored, the request is made conditional and a 304 Not
+        Modified is answered with the stored body (and the fresh headers). New
+        successful responses are stored.
+        """
+        if self.http_cache is None:
+            return await self._transport(
+                method, url, params, json, headers, timeout, token
+            )
+        key = self.http_cache.key(method, path, params, json)
+        entry = self.http_cache.get(key)
+        validators = {} if entry is None else self.http_cache.validators(entry, params)
+        if not validators:
+            entry = None  # not revalidated, a 200 replaces the stored response
+        headers = {**(headers or {}), **validators}
+        response, size = await self._transport(
+            method, url, params, json, headers, timeout, token
+        )
+        if entry is not None:
+            revalidated = response.status == 304
+            self.http_cache.count(revalidated)
+            metrics.annotate(cache="revalidated" if revalidated else "stale")
+            if revalidated:
+                self.http_cache.touch(key)
+                fresh_headers = CIMultiDict(entry.headers)
+                fresh_headers.update(response.headers)
+                return Response(200, fresh_headers, entry.data), size
+        if response.status == 200:
+            self.http_cache.set(key, response.headers, response.data)
+        return response, size
+
+    async def _transport(
+        self,
+        method: str,
+        url: str,
+        params: Dict,
+        json: Dict,
+        headers: Dict,
+        timeout: float,
+        token: str,
+    ) -> Tuple[Response, int]:
+        """Sends a request over the network, returns the response and its size."""
+        headers = dict(headers or {})
+        if token is not None:
+            headers["Authorization"] = f"token {token}"
+        timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        try:
+            async with self._get_session().request(
+                method, url, params=params, json=json, headers=headers, timeout=timeout
+            ) as resp:
+                body = await resp.read()
+                data = await resp.json(content_type=None) if body else None
+                return Response(resp.status, CIMultiDict(resp.headers), data), len(body)
+        except asyncio.TimeoutError:
+            raise RequestTimeoutError(f"Request timed out: {method} {url}")
+        except aiohttp.ClientError as e:
+            raise RequestTimeoutError(f"Request failed: {method} {url} ({e})")
+
+    async def get_user(self, username: str) -> Dict:
+        return (await self.request("GET", f"/users/{username}")).data
+
+    async def list_repos(
+        self, owner: str, is_org: bool, page: int = 1, per_page: int = 100
+    ) -> List[Dict]:
+        """Returns one page of the public repos of a user or org."""
+        kind = "orgs" if is_org else "users"
+        params = {"per_page": per_page, "page": page}
+        return (await self.request("GET", f"/{kind}/{owner}/repos", params)).data
+
+    async def list_stargazers(
+        self, full_name: str, page: int = 1, per_page: int = 100
+    ) -> Page:
+        """Returns one page of stargazers (with `starred_at` timestamps) of a repo."""
+        response = await self.request(
+            "GET",
+            f"/repos/{full_name}/stargazers",
+            params={"per_page": per_page, "page": page},
+            headers={"Accept": "application/vnd.github.v3.star+json"},
+        )
+        starred_at = [stargazer["starred_at"] for stargazer in response.data]
+        return Page(starred_at, last_page(response.headers))
+
+    async def get_contributors_stats(self, full_name: str) -> Response:
+        """
+        Returns the contributor stats of a repo. Note that Github computes these in
+        the background and returns status 202 (without data) until they are ready.
+        """
+        return await self.request("GET", f"/repos/{full_name}/stats/contributors")
+
+    async def rate_limit(self, token: str = None) -> Dict:
+        """
+        Returns the rate limits of a token and updates the scheduler with them.
+        Calls to this endpoint don't count against the rate limit.
+        """
+        token = token or self.scheduler.acquire("core")
+        data = (await self.request("GET", "/rate_limit", token=token)).data
+        for resource in ["core", "graphql"]:
+            limits = data["resources"][resource]
+            self.scheduler.set_quota(
+                token, resource, limits["remaining"], limits["limit"], limits["reset"]
+            )
+        return data
+
+    async def refresh_rate_limits(self) -> None:
+        """Updates the scheduler with the rate limits of all tokens."""
+        await asyncio.gather(
+            *[self.rate_limit(token) for token in self.scheduler.tokens]
+        )
+
+    async def graphql(self, query: str, variables: Dict = None) -> Dict:
+        """Runs a GraphQL query and returns its `data`."""
+        payload = {"query": query}
+        if variables:
+            payload["variables"] = variables
+        response = await self.request("POST", self.graphql_url, json=payload)
+        if response.data.get("errors") and not response.data.get("data"):
+            raise GithubError(f"GraphQL error: {response.data['errors']}")
+        return response.data["data"]
+
+
+class GithubClient:
+    def __init__(self, *args, **kwargs):
+        """
+        Sync facade for `AsyncGithubClient` (takes the same arguments).
+
+        The async client runs on an event loop in a daemon thread. Each method blocks
+        until its request is done. Use `gather` to run several requests at once.
+        """
+        self.aio = AsyncGithubClient(*args, **kwargs)
+        self.scheduler = self.aio.scheduler
+        self.http_cache = self.aio.http_cache
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._closed = False
+        self._lock = threading.Lock()  # orders `run` and `close`
+
+    def run(self, coro):
+        """
+        Runs a coroutine on the client's event loop and returns its result. Raises
+        `ClientClosedError` if the client is closed.
+        """
+        # Bind the coroutine to the caller's metrics span, so its API calls are
+        # counted for the query that made them.
+        coro = metrics.bind(coro)
+        with self._lock:
+            if self._closed:
+                coro.close()
+                raise ClientClosedError("Github client is closed")
+            future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return future.result()
+
+    def gather(self, coros: List) -> List:
+        """Runs several coroutines concurrently and returns their results in order."""
+
+        async def _gather():
+            return await asyncio.gather(*coros)
+
+        return self.run(_gather())
+
+    def close(self) -> None:
+        """
+        Closes the session and stops the event loop. Requests that are still in
+        flight (e.g. of worker threads when another query failed) are cancelled, so
+        their callers raise `CancelledError` instead of waiting forever.
+        """
+
+        async def _shutdown():
+            tasks = [
+                task
+                for task in asyncio.all_tasks()
+                if task is not asyncio.current_task()
+            ]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.aio.close()
+
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            # Submitted while holding the lock, so it runs after all earlier calls.
+            future = asyncio.run_coroutine_threadsafe(_shutdown(), self._loop)
+        try:
+            future.result()
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def get_user(self, username: str) -> Dict:
+        return self.run(self.aio.get_user(username))
+
+    def list_repos(self, owner: str, is_org: bool, num_pages: int = 1) -> List[Dict]:
+        """Returns all public repos of a user or org (pages are fetched in parallel)."""
+        results = self.gather(
+            [
+                self.aio.list_repos(owner, is_org, page)
+                for page in range(1, num_pages + 1)
+            ]
+        )
+        return [repo for result in results for repo in result]
+
+    def list_stargazers(
+        self, full_name: str, pages: List[Tuple[int, int]]
+    ) -> List[Page]:
+        """Returns several pages of stargazers, given as `(page, per_page)` tuples."""
+        return self.gather(
+            [self.aio.list_stargazers(full_name, *request) for request in pages]
+        )
+
+    def get_contributors_stats(self, full_name: str) -> Response:
+        return self.run(self.aio.get_contributors_stats(full_name))
+
+    def rate_limit(self, token: str = None) -> Dict:
+        return self.run(self.aio.rate_limit(token))
+
+    def refresh_rate_limits(self) -> None:
+        self.run(self.aio.refresh_rate_limits())
+
+    def graphql(self, query: str, variables: Dict = None) -> Dict:
+        return self.run(self.aio.graphql(query, variables))
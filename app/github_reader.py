@@ -2,72 +2,301 @@
 Contains methods to query user info and stats from the Github API.
 
 Note that Github hosts two APIs, a REST API (also known as v3) and a GraphQL API (v4),
-which are both used here. Expensive API calls are cached via streamlit's `st.cache`.
+which are both used here. Expensive API calls are cached in a persistent cache on
+disk (see `cache.py`) and, if configured, in memory (e.g. via streamlit's `st.cache`,
+see `configure`).
+
+This module doesn't depend on streamlit. The API client and caches are created on
+first use from the config (see `config.py`), or can be passed in via `configure`.
 """
 
+import asyncio
+import calendar
+import contextlib
+import functools
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import copy
-from typing import Dict, Tuple, List
-import functools
-import random
+from collections import deque, namedtuple
+from typing import Callable, Dict, Tuple, List, Union
 import warnings
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-import requests
-from fastcore.net import HTTP404NotFoundError
-import fastcore.net
-import streamlit as st
-from ghapi.core import GhApi
-from ghapi.page import pages
-
+import config
+import metrics
+import planner
 import utils
+import star_search
+from aggregator import StarsAggregator
+from cache import PersistentCache
+from cassette import Cassette
+from singleflight import SingleFlight
+from stargazer_index import StargazerIndex
+from github_client import GithubClient, NotFoundError
+from http_cache import HTTPCache
+
+
+# Maximum number of repos that are queried in parallel in `StatsMaker.stream`. Each
+# worker makes its own API calls, so tune this against the number of tokens.
+MAX_WORKERS = int(config.get("MAX_WORKERS", 8))
+
+# Engine to search for the year break in the stargazers of a repo (one of "binary",
+# "kary" or "interpolation", see `star_search`) and number of pages that the k-ary
+# search fetches in parallel in each round. Binary search needs the fewest API calls
+# of the engines that only fetch regular pages (which the stargazer index can reuse).
+# The k-ary search saves round-trips but costs more quota, so it's opt-in.
+SEARCH_ENGINE = config.get("SEARCH_ENGINE", "binary")
+SEARCH_FANOUT = int(config.get("SEARCH_FANOUT", 4))
+
+# Persistent cache, shared between processes that use the same directory. Results for
+# the current year expire after CACHE_TTL seconds, results for past years never do
+# (the stars in a past year can't change any more).
+CACHE_DIR = config.get("CACHE_DIR", ".cache")
+CACHE_MAX_ENTRIES = int(config.get("CACHE_MAX_ENTRIES", 100000))
+CACHE_TTL = float(config.get("CACHE_TTL", 3600))
+
+# Whether API responses are stored in an HTTP cache in CACHE_DIR and revalidated with
+# conditional requests, which don't count against the rate limit (see
+# `http_cache.py`).
+HTTP_CACHE = bool(int(config.get("HTTP_CACHE", 1)))
+
+# How new stars are counted in `StatsMaker.stream` by default: "exact" searches each
+# repo, "approximate" only estimates them from a few sampled pages (at most
+# APPROX_BUDGET API calls per repo, see `_estimate_repo`) and "refine" shows the
+# estimates first and then replaces them with exact counts.
+STARS_MODE = config.get("STARS_MODE", "exact")
+APPROX_BUDGET = int(config.get("APPROX_BUDGET", 8))
+
+# Maximum number of API calls to count the new stars of one user in
+# `StatsMaker.stream` (0 = no limit). Repos are searched likely-hot first (see
+# `planner.py`), so the stats cover the most important repos when the budget runs
+# out. The new stars are then marked as lower bound.
+USER_API_BUDGET = int(config.get("USER_API_BUDGET", 0))
+
+# Repos with at least this many stars are counted through the GraphQL API, which can
+# read stargazers newest first (see `_count_stars_graphql`). The REST API only
+# returns the first 40k stargazers, so new stars of larger repos can't be counted
+# exactly with the search.
+GRAPHQL_MIN_STARS = int(config.get("GRAPHQL_MIN_STARS", 40000))
+
+# Number of top external repos of a user whose new stars are counted speculatively in
+# the background, before they're selected (0 = no prefetch, see
+# `StatsMaker.prefetch_external`). Prefetching stops once it would use up more than
+# the pooled rate limit minus PREFETCH_QUOTA_FLOOR (a share of the limit), so it
+# never starves foreground queries.
+PREFETCH_EXTERNAL = int(config.get("PREFETCH_EXTERNAL", 3))
+PREFETCH_QUOTA_FLOOR = float(config.get("PREFETCH_QUOTA_FLOOR", 0.25))
+
+# Concurrent calls of the queries below with the same arguments (e.g. from different
+# streamlit sessions) wait for one computation instead of repeating its API calls.
+single_flight = SingleFlight()
+
+# Objects that are created on first use (or passed in via `configure`).
+_client = None
+_persistent_cache = None
+_stargazer_index = None
+
+# Prefetch runs in a single worker thread (i.e. at low priority). `_prefetching` holds
+# the keys of the queries that are queued or running there.
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+_prefetching = set()
+
+
+def configure(
+    client: GithubClient = None,
+    persistent_cache: PersistentCache = None,
+    stargazer_index: StargazerIndex = None,
+    memoize: Callable[[Callable], Callable] = None,
+) -> None:
+    """
+    Replaces the API client, caches or in-memory memoization used by the queries.
+
+    Args:
+        client (GithubClient, optional): API client, e.g. pointing to a stub server.
+        persistent_cache (PersistentCache, optional): Cache for query results.
+        stargazer_index (StargazerIndex, optional): Index of stargazer pages.
+        memoize (callable, optional): Decorator that adds an in-memory cache to the
+            queries, e.g. `st.cache`. By default, there's no in-memory cache.
+    """
+    global _client, _persistent_cache, _stargazer_index
+    global _query_user, _query_repo, _estimate_repo
+    if client is not None:
+        _client = client
+    if persistent_cache is not None:
+        _persistent_cache = persistent_cache
+    if stargazer_index is not None:
+        _stargazer_index = stargazer_index
+    if memoize is not None:
+        _query_user = _traced(memoize(_query_user_base), "query_user")
+        _query_repo = _traced(memoize(_query_repo_base), "query_repo")
+        _estimate_repo = _traced(memoize(_estimate_repo_base), "estimate_repo")
+
+
+def make_client(cassette: Cassette = None) -> GithubClient:
+    """
+    Creates an API client. It picks the token from GH_TOKENS with the most
+    remaining quota for each request and raises a timeout error if a request takes
+    too long. Timeouts can happen sometimes when a user has lots of repos.
+
+    If a cassette is passed (or configured via GH_CASSETTE), all responses are
+    recorded to it or replayed from it (see `cassette.py`). Replaying doesn't need
+    any tokens. Unless HTTP_CACHE is disabled, responses are revalidated through
+    an HTTP cache (not when replaying).
+    """
+    if cassette is None and config.get("GH_CASSETTE"):
+        cassette = Cassette(
+            config.get("GH_CASSETTE"),
+            mode=config.get("GH_CASSETTE_MODE", "replay"),
+            latency_scale=float(config.get("GH_CASSETTE_LATENCY", 1.0)),
+        )
+    tokens = config.get("GH_TOKENS")
+    if tokens:
+        tokens = tokens.split(",")
+    elif cassette is not None and cassette.replaying:
+        tokens = ["replay"]
+    else:
+        raise RuntimeError(
+            "Couldn't find a token for Github API! Specify via env variable GH_TOKENS"
+        )
+    print(f"Found {len(tokens)} token(s) for Github API")
+    replaying = cassette is not None and cassette.replaying
+    return GithubClient(
+        tokens,
+        base_url=config.get("GH_API_URL", "https://api.github.com"),
+        cassette=cassette,
+        http_cache=HTTPCache(CACHE_DIR) if HTTP_CACHE and not replaying else None,
+    )
 
 
-# Monkey-patch ghapi/fastcore. This makes it raise a timeout error if an API request
-# through ghapi takes too long. Timeouts can happen sometimes when a user has lots of
-# repos.
-fastcore.net._opener.open = functools.partial(fastcore.net._opener.open, timeout=15)
+def get_client() -> GithubClient:
+    """Returns the API client (see `make_client`)."""
+    global _client
+    if _client is None:
+        _client = make_client()
+    return _client
 
 
-# Set up the Github REST API client.
-# Note that ghapi contains a bug in the `paged` method as of December 2020, therefore
-# it's safer to install my fork (see README.md for instructions).
-if "GH_TOKENS" in st.secrets:
-    GH_TOKENS = st.secrets["GH_TOKENS"].split(",")
-    print(f"Found {len(GH_TOKENS)} token(s) for Github API")
-else:
-    raise RuntimeError(
-        "Couldn't find a token for Github API! Specify via env variable GH_TOKENS"
-    )
+def close() -> None:
+    """Closes the API client (if one was created), e.g. before a script exits."""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def get_persistent_cache() -> PersistentCache:
+    global _persistent_cache
+    if _persistent_cache is None:
+        _persistent_cache = PersistentCache(CACHE_DIR, max_entries=CACHE_MAX_ENTRIES)
+    return _persistent_cache
+
+
+def get_stargazer_index() -> StargazerIndex:
+    """Returns the index of stargazer pages that were already fetched."""
+    global _stargazer_index
+    if _stargazer_index is None:
+        _stargazer_index = StargazerIndex(CACHE_DIR, max_age=CACHE_TTL)
+    return _stargazer_index
+
+
+def _cache_ttl(*args) -> Union[float, None]:
+    """
+    Returns the TTL for a cached query. The second argument is always the year or
+    the `(start, end)` time ranges of the query. A third argument that is a tuple
+    holds more time ranges that the result is used for (e.g. the periods that the
+    repo metadata of `_query_user` is used for). Results for past time spans never
+    expire.
+    """
+    if isinstance(args[1], int):
+        end = year_period(args[1]).end
+    else:
+        end = max(end for _, end in args[1])
+    if len(args) > 2 and isinstance(args[2], tuple):
+        end = max([end] + [range_end for _, range_end in args[2]])
+    return CACHE_TTL if end > _now() else None
+
 
-api = GhApi(
-    token=random.choice(GH_TOKENS),
-    limit_cb=lambda rem, quota: print(f"Quota remaining: {rem} of {quota}"),
-)
+def _persistent(version: int = 1) -> Callable:
+    """Decorator that caches a query in the (lazily created) persistent cache."""
 
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            memoized = get_persistent_cache().memoize(_cache_ttl, version)(func)
+            return memoized(*args)
 
-def switch_api_token():
-    """Update API to use a new, random token from the env variable GH_TOKENS."""
-    api.headers["Authorization"] = f"token {random.choice(GH_TOKENS)}"
-    print("Switched API token")
+        return wrapper
+
+    return decorator
+
+
+def _above_quota_floor(resource: str, expected_calls: int) -> bool:
+    """
+    Returns True if the pooled quota for `resource` stays above PREFETCH_QUOTA_FLOOR
+    after `expected_calls` more calls.
+    """
+    capacity = get_client().scheduler.capacity(resource)
+    remaining = capacity["remaining"] - expected_calls
+    return remaining >= PREFETCH_QUOTA_FLOOR * capacity["limit"]
+
+
+def _prefetch(
+    key: Tuple, func: Callable, args: Tuple, resource: str, expected_calls: int
+) -> None:
+    """
+    Runs the query `func(*args)` in the prefetch worker, unless it would dip below
+    the quota floor. Errors are only logged, the query is repeated (and raises
+    them) if the repo is selected later.
+    """
+    try:
+        if _above_quota_floor(resource, expected_calls):
+            func(*args)
+        else:
+            print(f"Skipped prefetch of {args[0]}, quota floor reached")
+    except Exception as e:
+        print(f"Prefetch of {args[0]} failed:", e)
+    finally:
+        _prefetching.discard(key)
 
 
 def rate_limit_info() -> Dict:
-    """Return information about reamining API calls (on REST API and GraphQL API)."""
-    limits = api.rate_limit.get()
-    d = {
-        "core_remaining": limits.resources.core.remaining,
-        "core_reset": utils.format_timedelta(
-            datetime.fromtimestamp(limits.resources.core.reset) - datetime.now()
-        ),
-        "graphql_remaining": limits.resources.graphql.remaining,
-        "graphql_reset": utils.format_timedelta(
-            datetime.fromtimestamp(limits.resources.graphql.reset) - datetime.now()
-        ),
-    }
+    """
+    Return information about remaining API calls (on REST API and GraphQL API),
+    pooled over all tokens.
+
+    This reads the quotas the client captured from the `X-RateLimit-*` headers of
+    earlier responses, so it doesn't make any API calls. Until a resource was used
+    for the first time, its remaining calls are shown as "?".
+    """
+    scheduler = get_client().scheduler
+    d = {}
+    for resource in ["core", "graphql"]:
+        capacity = scheduler.capacity(resource)
+        remaining = capacity["remaining"] if capacity["observed"] else "?"
+        d[f"{resource}_remaining"] = remaining
+        d[f"{resource}_limit"] = capacity["limit"]
+        d[f"{resource}_reset"] = utils.format_timedelta(
+            max(datetime.fromtimestamp(capacity["reset"]) - datetime.now(), timedelta())
+        )
+        d[f"{resource}_available"] = capacity["available"]
+    d["num_tokens"] = len(scheduler.tokens)
     return d
 
 
+def token_usage() -> List[Dict]:
+    """Return remaining quota and number of requests per token and resource."""
+    return get_client().scheduler.usage()
+
+
+# Objects that are used by the queries but shouldn't be hashed by st.cache.
+HASH_FUNCS = {
+    GithubClient: lambda _: None,
+    PersistentCache: lambda _: None,
+    StargazerIndex: lambda _: None,
+    SingleFlight: lambda _: None,
+}
+
+
 class UserNotFoundError(Exception):
     pass
 
@@ -76,9 +305,171 @@ class TimeoutError(Exception):
     pass
 
 
-@st.cache(hash_funcs={"ghapi.core._GhVerb": lambda _: None}, show_spinner=False)
-def _query_user(username: str, year: int) -> Tuple:
-    """Retrieves user infos + own repos + external repos from the Github API."""
+class LargeRepoWarning(UserWarning):
+    """Warns that not all new stars of a repo with >40k stars can be counted."""
+
+    pass
+
+
+# Warn for every user, not only the first one in this process (the app shows the
+# warnings of each job, see `jobs.py`).
+warnings.simplefilter("always", LargeRepoWarning)
+
+
+# Year of the stats if neither a year nor periods are given.
+DEFAULT_YEAR = 2021
+
+# Time span to count new stars in, from `start` (inclusive) to `end` (exclusive),
+# both ISO 8601 timestamps in UTC. `label` is used as key in the stats.
+Period = namedtuple("Period", ["label", "start", "end"])
+
+
+def year_period(year: int) -> Period:
+    """Returns the period for a calendar year."""
+    return Period(str(year), f"{year}-01-01T00:00:00Z", f"{year + 1}-01-01T00:00:00Z")
+
+
+def parse_period(text: str) -> Period:
+    """
+    Parses a period from a year (e.g. "2021") or a range of dates with inclusive
+    end (e.g. "2021-03-01..2021-06-30"). Raises ValueError for other formats.
+    """
+    if ".." not in text:
+        return year_period(int(text))
+    start, end = (datetime.strptime(date, "%Y-%m-%d") for date in text.split(".."))
+    if end < start:
+        raise ValueError(f"Period ends before it starts: {text}")
+    end += timedelta(days=1)
+    return Period(
+        text, start.strftime("%Y-%m-%dT%H:%M:%SZ"), end.strftime("%Y-%m-%dT%H:%M:%SZ")
+    )
+
+
+def stats_year(year: Union[int, None], periods: List[Period] = None) -> int:
+    """
+    Returns the year of the stats (e.g. for contributions): `year` if given,
+    otherwise the year that the first period starts in (or DEFAULT_YEAR without
+    periods). Raises ValueError if `year` doesn't overlap with any of the periods.
+    """
+    if year is None:
+        return int(periods[0].start[:4]) if periods else DEFAULT_YEAR
+    span = year_period(year)
+    if periods and not any(
+        period.start < span.end and span.start < period.end for period in periods
+    ):
+        raise ValueError(f"None of the periods overlaps the year {year}")
+    return year
+
+
+def _now() -> str:
+    """Returns the current time as ISO 8601 timestamp (comparable to `starred_at`)."""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _initial_new_stars(
+    stargazer_count: int, created_at: str, period: Period, updated_at: str = None
+):
+    """
+    Returns the number of new stars of a repo in a period if it can be determined
+    from the repo metadata alone, or None if the repo needs to be searched with
+    `_query_repo`.
+    """
+    # Several options to minimize time & amount of API calls.
+    if stargazer_count == 0 or created_at >= period.end:
+        # No stars at all or the repo didn't exist yet.
+        return 0
+    elif updated_at is not None and updated_at < period.start:
+        # Github updates `updatedAt` when a repo is starred, so a repo that wasn't
+        # updated since before the period can't have new stars in it.
+        return 0
+    elif created_at >= period.start and period.end > _now():
+        # Created in the period, which isn't over yet: all stars are new.
+        return stargazer_count
+    else:
+        return None
+
+
+def _list_own_repos(username: str) -> List[Dict]:
+    """
+    Returns name, creation date and star count of all public repos that a user or
+    org owns, through the GraphQL API (100 repos per request).
+    """
+    query = """query($login: String!, $cursor: String) {
+        repositoryOwner(login: $login) {
+            repositories(
+                first: 100, after: $cursor, privacy: PUBLIC, ownerAffiliations: OWNER
+            ) {
+                nodes {
+                    nameWithOwner
+                    createdAt
+                    updatedAt
+                    pushedAt
+                    stargazerCount
+                }
+                pageInfo {
+                    hasNextPage
+                    endCursor
+                }
+            }
+        }
+    }"""
+    repos = []
+    cursor = None
+    while True:
+        data = get_client().graphql(query, {"login": username, "cursor": cursor})
+        connection = data["repositoryOwner"]["repositories"]
+        repos.extend(connection["nodes"])
+        if not connection["pageInfo"]["hasNextPage"]:
+            return repos
+        cursor = connection["pageInfo"]["endCursor"]
+
+
+def query_repos_metadata(full_names: List[str], batch_size: int = 50) -> Dict:
+    """
+    Returns name, creation/update/push dates and star count of several repos (as a
+    dict from the given name to the metadata), through the GraphQL API. Repos are
+    batched into one request with aliased sub-queries, owners and names are passed
+    as variables. Repos that don't exist or names that aren't of the form
+    `owner/name` are skipped.
+    """
+    full_names = [
+        full_name
+        for full_name in full_names
+        if full_name.count("/") == 1 and all(full_name.split("/"))
+    ]
+    repos = {}
+    for i in range(0, len(full_names), batch_size):
+        batch = full_names[i : i + batch_size]
+        parameters, subqueries, variables = [], [], {}
+        for j, full_name in enumerate(batch):
+            variables[f"o{j}"], variables[f"n{j}"] = full_name.split("/")
+            parameters.append(f"$o{j}: String!, $n{j}: String!")
+            subqueries.append(
+                f"r{j}: repository(owner: $o{j}, name: $n{j}) "
+                "{ nameWithOwner createdAt updatedAt pushedAt stargazerCount }"
+            )
+        query = (
+            f"query({', '.join(parameters)}) {{\n" + "\n".join(subqueries) + "\n}"
+        )
+        data = get_client().graphql(query, variables)
+        for j, full_name in enumerate(batch):
+            if data.get(f"r{j}") is not None:
+                repos[full_name] = data[f"r{j}"]
+    return repos
+
+
+@single_flight.wrap
+@_persistent(version=5)
+def _query_user(
+    username: str, year: int, ranges: Tuple[Tuple[str, str], ...] = ()
+) -> Tuple:
+    """
+    Retrieves user infos + own repos + external repos from the Github API. Returns
+    the names of own and external repos and the metadata of all of them (creation,
+    update and push dates and number of stars). Contributions are counted in `year`.
+    The repo metadata is used to count new stars in `ranges` (`(start, end)` ISO
+    8601 timestamps), so the result only stays cached forever if they're all over.
+    """
 
     print("-" * 80)
     print("Querying API for user:", username)
@@ -88,71 +479,31 @@ def _query_user(username: str, year: int) -> Tuple:
     # 1) Query REST API to find out if the user is an organization. This has to be done
     #    first because the following queries are different for users and orgs.
     try:
-        switch_api_token()
-        user = api.users.get_by_username(username)
-    except HTTP404NotFoundError:
+        user = get_client().get_user(username)
+    except NotFoundError:
         raise UserNotFoundError(
             f"Received 404 error when searching for user: {username}"
         )
-    is_org = user.type == "Organization"
-    num_repos = user.public_repos
-
-    # 2) Query REST API to get all repos that the user owns and count their new stars.
-    # TODO: Maybe do this with the GraphQL API. Bit more complicated to handle
-    #   pagination though + it's a lot of new code for 0.5 s performance increase.
-    own_repo_stars = {}
-    contributor_names = set()  # only used if is_org is True
-    contributors_greater_than = False
-    endpoint = api.repos.list_for_org if is_org else api.repos.list_for_user
-    num_pages = 1 + int(num_repos / 100)
-    switch_api_token()
-    for repo in pages(endpoint, num_pages, username).concat():
-
+    is_org = user["type"] == "Organization"
+
+    # 2) Query GraphQL API to get all repos that the user owns and their metadata
+    #    (new stars are counted later in `StatsMaker`). This only transfers the
+    #    fields we need (in contrast to the REST API).
+    own_repos = []
+    repo_metadata = {}  # dates + total stars of own and external repos
+    for repo in _list_own_repos(username):
         print(
-            f"{repo.full_name[:40]:40} (created: {repo.created_at}, stars: {repo.stargazers_count})",
+            f"{repo['nameWithOwner'][:40]:40} (created: {repo['createdAt']}, stars: {repo['stargazerCount']})",
         )
+        own_repos.append(repo["nameWithOwner"])
+        repo_metadata[repo["nameWithOwner"]] = repo
 
-        # Count new stars (several options to minimize time & amount of API calls).
-        if repo.stargazers_count == 0:
-            new_stars = 0
-            print("No stars at all")
-        elif int(repo.created_at[:4]) == year:
-            new_stars = repo.stargazers_count
-            print("Created this year, count all stars:", new_stars)
-        else:
-            new_stars = None
-            print("Needs intense analysis, do later")
-        own_repo_stars[repo.full_name] = new_stars
-
-        # For orgs: Count number of contributors across all repos.
-        # TODO: For large orgs, this can take a significant amount of time. Should show
-        #   progress in more detail here.
-        if is_org:
-            year_start = datetime(year, 1, 1, 0, 0, 0)
-            year_end = datetime(year, 12, 31, 23, 59, 59)
-            repo_contributor_names = set()
-            # TODO: This only returns the 100 most active contributors and there's no
-            #   way to get more, i.e. it doesn't work for very popular repos. Maybe look for
-            #   another way to do this.
-            switch_api_token()
-            contributors = api.repos.get_contributors_stats(repo.owner.login, repo.name)
-            if len(contributors) == 100:
-                contributors_greater_than = True
-            for contributor in contributors:
-                # print(
-                #     f"Analyzing contributor f{contributor.author.login} ({contributor.total} contributions)"
-                # )
-                for week_stats in contributor.weeks:
-                    week = datetime.fromtimestamp(int(week_stats.w))
-                    if week_stats.c > 0 and week > year_start and week < year_end:
-                        # print(f"Found {week_stats.c} contributions in week {week}")
-                        # print()
-                        repo_contributor_names.add(contributor.author.login)
-                        break
-            print(f"Found {len(repo_contributor_names)} contributors")
-            contributor_names |= repo_contributor_names
-
-        print()
+    # For orgs: Count number of contributors across all repos. Contributor stats for
+    # all repos are requested at once.
+    if is_org:
+        contributor_names, contributors_greater_than = _query_org_contributors(
+            own_repos, year
+        )
 
     # 3) Query GraphQL API to get contribution counts + external repos.
     if is_org:
@@ -161,13 +512,8 @@ def _query_user(username: str, year: int) -> Tuple:
         repos_contributed_to = len(contributor_names)
         if contributors_greater_than:
             repos_contributed_to = ">" + str(repos_contributed_to)
-        external_repo_stars = {}
+        external_repos = []
     else:
-        url = "https://api.github.com/graphql"
-        if "Authorization" in api.headers:
-            headers = {"Authorization": api.headers["Authorization"]}
-        else:
-            headers = {}
         query = f"""query {{
             user(login: "{username}") {{
                 contributionsCollection(from: "{year}-01-01T00:00:00Z", to: "{year}-12-31T23:59:59Z") {{
@@ -179,6 +525,8 @@ def _query_user(username: str, year: int) -> Tuple:
                         repository {{
                             nameWithOwner
                             createdAt
+                            updatedAt
+                            pushedAt
                             stargazerCount
                         }}
                         contributions {{
@@ -189,8 +537,8 @@ def _query_user(username: str, year: int) -> Tuple:
             }}
         }}"""
 
-        response = requests.post(url, headers=headers, json={"query": query})
-        contrib_collection = response.json()["data"]["user"]["contributionsCollection"]
+        data = get_client().graphql(query)
+        contrib_collection = data["user"]["contributionsCollection"]
         contributions = contrib_collection["contributionCalendar"]["totalContributions"]
         # Repos are already sorted from GraphQL by number of contributions.
         # TODO: This only returns 100 (?) repos at most. Does it make sense to get more via
@@ -199,32 +547,18 @@ def _query_user(username: str, year: int) -> Tuple:
         repos_contributed_to = contrib_collection[
             "totalRepositoriesWithContributedCommits"
         ]
-        external_repos = [
-            item["repository"]
-            for item in contrib_collection["commitContributionsByRepository"]
-            if item["repository"]["nameWithOwner"].split("/")[0] != username
-        ]
-
-        # Parse external repos but do not do binary search here (it's too expensive
+        # Store external repos but do not search their stars here (it's too expensive
         # and will be done later when required).
-        external_repo_stars = {}
-        for repo in external_repos:
+        external_repos = []
+        for item in contrib_collection["commitContributionsByRepository"]:
+            repo = item["repository"]
+            if repo["nameWithOwner"].split("/")[0] == username:
+                continue
             print(
                 f"{repo['nameWithOwner'][:40]:40} (created: {repo['createdAt']}, stars: {repo['stargazerCount']})",
             )
-
-            # Count new stars (several options to minimize time & amount of API calls).
-            if repo["stargazerCount"] == 0:
-                new_stars = 0
-                print("No stars at all")
-            elif int(repo["createdAt"][:4]) == year:
-                new_stars = repo["stargazerCount"]
-                print("Created this year, count all stars:", new_stars)
-            else:
-                new_stars = None
-                print("Needs intense analysis, do later")
-            external_repo_stars[repo["nameWithOwner"]] = new_stars
-            print()
+            external_repos.append(repo["nameWithOwner"])
+            repo_metadata[repo["nameWithOwner"]] = repo
 
     print(f"Took {time.time() - start_time} s")
     print("-" * 80)
@@ -233,153 +567,484 @@ def _query_user(username: str, year: int) -> Tuple:
         is_org,
         contributions,
         repos_contributed_to,
-        own_repo_stars,
-        external_repo_stars,
+        own_repos,
+        external_repos,
+        repo_metadata,
     )
 
 
-@st.cache(hash_funcs={"ghapi.core._GhVerb": lambda _: None}, show_spinner=False)
-def _query_repo(full_name: str, year: int) -> int:
-    """Returns number of new stars in a year through binary search on the Github API."""
-    
+@single_flight.wrap
+@_persistent(version=2)
+def _query_repo(
+    full_name: str, ranges: Tuple[Tuple[str, str], ...], use_graphql: bool = False
+) -> Tuple[int, ...]:
+    """
+    Returns the number of new stars of a repo in each of several time ranges
+    (`(start, end)` ISO 8601 timestamps, end exclusive). The stars before each range
+    boundary are searched on the Github REST API. All searches share the fetched
+    pages, so extra ranges (e.g. the year before) cost few or no extra API calls.
+    If `use_graphql`, the stargazers are instead read newest first from the GraphQL
+    API down to the earliest boundary and sorted into the ranges in one pass.
+    """
+
     print(full_name)
+    boundaries = sorted({boundary for time_range in ranges for boundary in time_range})
+    if use_graphql:
+        stars_after = _count_stars_graphql(full_name, boundaries)
+        return tuple(stars_after[start] - stars_after[end] for start, end in ranges)
+
+    # Find the number of stars before each boundary (see `star_search` for the
+    # available engines) and subtract it from the total number of stars. Pages that
+    # are already in the index don't need to be fetched again. Boundaries in the
+    # future don't need a search.
+    client = get_client()
+    index = get_stargazer_index()
+    pages = index.load_pages(
+        full_name, lambda requests: client.list_stargazers(full_name, requests)
+    )
+    engine = star_search.ENGINES[SEARCH_ENGINE]
+    kwargs = {"fanout": SEARCH_FANOUT} if SEARCH_ENGINE == "kary" else {}
+    now = _now()
+    stars_before = {
+        boundary: engine(pages, boundary, **kwargs) if boundary <= now else pages.total
+        for boundary in boundaries
+    }
+    new_stars = tuple(stars_before[end] - stars_before[start] for start, end in ranges)
+    index.save(full_name, pages)
+    print("Total pages:", pages.num_pages)
+
+    # Report API calls next to the ones binary search would have needed (with the
+    # same page sharing). This doesn't fetch the last page just for the report: If
+    # the total isn't known, any total with the same number of pages gives the same
+    # number of calls.
+    searched = [before for boundary, before in stars_before.items() if boundary <= now]
+    baseline = star_search.simulate(
+        star_search.binary_search,
+        searched,
+        pages.known_total or pages.num_pages * pages.per_page,
+        count_total=len(searched) < len(stars_before),
+    ).calls
+    print(
+        f"API calls: {pages.calls} in {pages.rounds} round-trips with "
+        f"{SEARCH_ENGINE} search (binary search: {baseline})"
+    )
+    print("New stars:", new_stars)
+    print()
+    return new_stars
+
+
+@single_flight.wrap
+@_persistent()
+def _estimate_repo(
+    full_name: str, ranges: Tuple[Tuple[str, str], ...], total: int
+) -> Tuple[Tuple[star_search.Estimate, ...], Dict[str, int]]:
+    """
+    Estimates the number of new stars of a repo in each time range from a few
+    sampled pages of stargazers, with at most APPROX_BUDGET API calls (see
+    `star_search.sample`). Each estimate comes with bounds that always contain the
+    exact number. Also returns the estimated new stars per month over all ranges.
+
+    `total` is the number of stars from the repo's metadata. It's only used for
+    repos with 40k stars or more, where the REST API can't reach the last page.
+    The sampled pages are stored in the stargazer index, so a later exact search of
+    the same repo starts from them.
+    """
 
-    def get_stargazers(page: int):
-        """Retrieves a page of stargazers from the Github API."""
-        switch_api_token()
-        return api.activity.list_stargazers_for_repo(
-            *full_name.split("/"),
-            headers={"Accept": "application/vnd.github.v3.star+json"},
-            per_page=100,
-            page=page,
+    print(full_name)
+    client = get_client()
+    index = get_stargazer_index()
+    pages = index.load_pages(
+        full_name, lambda requests: client.list_stargazers(full_name, requests)
+    )
+    boundaries = sorted({boundary for time_range in ranges for boundary in time_range})
+    now = _now()
+    before = dict(
+        zip(
+            boundaries,
+            star_search.sample(pages, boundaries, total, now, APPROX_BUDGET),
         )
+    )
+    estimates = []
+    for start, end in ranges:
+        low = max(0, before[end].low - before[start].high)
+        high = before[end].high - before[start].low
+        value = min(high, max(low, before[end].value - before[start].value))
+        estimates.append(star_search.Estimate(value, low, high))
+    if pages.num_pages < star_search.MAX_PAGE:
+        total = pages.total  # exact (no API call, the last page was sampled)
+    histogram = star_search.monthly_histogram(
+        pages, boundaries[0], boundaries[-1], total, now
+    )
+    index.save(full_name, pages)
+    print(f"API calls: {pages.calls} in {pages.rounds} round-trips (approximate)")
+    print("Estimated new stars:", estimates)
+    print()
+    return tuple(estimates), histogram
+
+
+def _traced(func: Callable, name: str) -> Callable:
+    """
+    Runs each call of a query in a metrics span. The persistent cache and
+    single-flight set the `cache` label of the span. If neither of them is reached,
+    the call was answered by the in-memory cache.
+    """
+    return metrics.traced("query", query=name, cache="memory")(func)
+
+
+# Keep the queries without in-memory cache, so `configure` can wrap them again.
+_query_user_base = _query_user
+_query_repo_base = _query_repo
+_estimate_repo_base = _estimate_repo
+_query_user = _traced(_query_user_base, "query_user")
+_query_repo = _traced(_query_repo_base, "query_repo")
+_estimate_repo = _traced(_estimate_repo_base, "estimate_repo")
+
+
+def _count_stars_graphql(full_name: str, boundaries: List[str]) -> Dict[str, int]:
+    """
+    Returns the number of stars on or after each boundary (as a dict) by reading
+    stargazers newest first.
+    """
+    owner, name = full_name.split("/")
+    query = """query($owner: String!, $name: String!, $cursor: String) {
+        repository(owner: $owner, name: $name) {
+            stargazers(
+                first: 100,
+                after: $cursor,
+                orderBy: {field: STARRED_AT, direction: DESC}
+            ) {
+                edges {
+                    starredAt
+                }
+                pageInfo {
+                    hasNextPage
+                    endCursor
+                }
+            }
+        }
+    }"""
+
+    def fetch_desc(cursor):
+        """Retrieves the next page of stargazers (newest first)."""
+        variables = {"owner": owner, "name": name, "cursor": cursor}
+        data = get_client().graphql(query, variables)
+        stargazers = data["repository"]["stargazers"]
+        starred_at = [edge["starredAt"] for edge in stargazers["edges"]]
+        page_info = stargazers["pageInfo"]
+        return starred_at, page_info["endCursor"] if page_info["hasNextPage"] else None
+
+    stars_after, calls = star_search.count_descending(fetch_desc, boundaries)
+    print(f"API calls: {calls} with GraphQL (newest first)")
+    print("Stars after boundaries:", stars_after)
+    print()
+    return dict(zip(boundaries, stars_after))
+
+
+WEEK = 7 * 24 * 60 * 60
+
+
+def _contributed_in(weeks: List[Dict], start: int, end: int) -> bool:
+    """
+    Returns True if there's a week with commits between the epoch timestamps `start`
+    and `end` in the weekly contributor stats of the Github API.
+    """
+    if not weeks:
+        return False
+    # Weeks are consecutive, so the ones in the range can be found by their offset
+    # from the first week, without looking at all weeks since the repo was created.
+    first_week = int(weeks[0]["w"])
+    from_idx = max(0, -(-(start - first_week) // WEEK))
+    # Clamped at 0 for repos created after `end` (a negative index would slice from
+    # the back).
+    to_idx = max(0, min(len(weeks), (end - first_week) // WEEK + 1))
+    in_range = weeks[from_idx:to_idx]
+    if in_range and not start <= int(in_range[0]["w"]) <= int(in_range[-1]["w"]) <= end:
+        # Weeks aren't consecutive (shouldn't happen), check all of them.
+        in_range = [week for week in weeks if start <= int(week["w"]) <= end]
+    return any(week["c"] > 0 for week in in_range)
+
+
+async def _get_contributors_stats(
+    full_name: str, max_polls: int = 6, delay: float = 1
+) -> List[Dict]:
+    """
+    Returns the contributor stats of a repo. Github computes these in the background
+    and returns status 202 until they are ready, so this polls with exponential
+    backoff (and returns an empty list if they aren't ready after `max_polls`).
+    """
+    for _ in range(max_polls):
+        response = await get_client().aio.get_contributors_stats(full_name)
+        if response.status != 202:
+            return response.data or []  # empty repos return 204 without data
+        await asyncio.sleep(delay)
+        delay = min(2 * delay, 16)
+    print(f"Contributor stats for {full_name} not ready, skipping")
+    return []
+
+
+def _query_org_contributors(full_names: List[str], year: int) -> Tuple[set, bool]:
+    """
+    Returns the names of all users who committed to the repos in `year` and whether
+    there may be more (the API returns only the top 100 contributors per repo).
+    """
+    start = calendar.timegm((year, 1, 1, 0, 0, 0))
+    end = calendar.timegm((year, 12, 31, 23, 59, 59))
+    all_stats = get_client().gather(
+        [_get_contributors_stats(repo) for repo in full_names]
+    )
 
-    def count_new(stargazers) -> int:
-        """Returns number of stargazers who starred in `year`."""
-        new_stars = 0
-        for stargazer in stargazers:
-            if int(stargazer.starred_at[:4]) == year:
-                new_stars += 1
-        return new_stars
-
-    # Query first page of stargazers (required to retrieve total number of pages).
-    # Also, most repos only have one page anyway (i.e. <100 stars).
-    stargazers = get_stargazers(1)
-    new_stars = count_new(stargazers)
-    num_pages = max(1, api.last_page())  # ghapi returns 0 here if there's only 1 page
-    print("Total pages:", num_pages)
-    
-    # TODO: This doesn't work when the result is cached.
-    if num_pages == 400:
-        warnings.warn("⚠️ You selected a repo with >40k stars. Due to a limitation in "
-                      "the Github API, it's not possible to count all new stars for "
-                      "this repo. The numbers below may be a bit off.")
-
-    if num_pages == 1:  # only one page
-        print("Total new stars:", new_stars)
-        print()
-        return new_stars
-    elif new_stars > 0 and new_stars < len(stargazers):  # break is on first page
-        print("Found year break on first page")
-
-        # Add all stars on the last page.
-        new_stars += len(get_stargazers(num_pages))
-
-        # Add 100 stars for each page in between.
-        if num_pages > 2:
-            new_stars += (num_pages - 2) * 100
-
-        print("Total new stars:", new_stars)
-        print()
-        return new_stars
-    else:
-        # If there's more than 1 page: Use binary search to find the page that contains
-        # the break from 2019 to 2020.
-        # Start on 2nd page b/c we already searched the 1st one.
-        from_page = 2
-        to_page = num_pages
-
-        while from_page <= to_page:
-            page = (from_page + to_page) // 2
-            print(f"Searching from page {from_page} to {to_page}, looking at {page}")
-
-            # Get year of first and last stargazer on the page.
-            stargazers = get_stargazers(page)
-            top_year = int(stargazers[0].starred_at[:4])
-            bottom_year = int(stargazers[-1].starred_at[:4])
-            # print(top_year, bottom_year)
-
-            # TODO: Check if everything works properly for 2021.
-            if from_page == to_page or (top_year < year and bottom_year >= year):
-                # Either `page` is the one with the year break, or we reached the first
-                # or last page and the year break is not contained in any page.
-                print("Page:", page, "-> found it!")
-                break
-            elif bottom_year < year and top_year < year:  # before 2020
-                from_page = min(num_pages, page + 1)
-                print("Page:", page, "-> before 2020, setting from_page to:", from_page)
-            elif bottom_year >= year and top_year >= year:  # equal to or after 2020
-                to_page = max(1, page - 1)
-                print("Page:", page, "-> before 2020, setting to_page to:", to_page)
+    contributor_names = set()
+    contributors_greater_than = False
+    for repo, contributors in zip(full_names, all_stats):
+        # TODO: This only returns the 100 most active contributors and there's no
+        #   way to get more, i.e. it doesn't work for very popular repos. Maybe look for
+        #   another way to do this.
+        if len(contributors) == 100:
+            contributors_greater_than = True
+        repo_contributor_names = {
+            contributor["author"]["login"]
+            for contributor in contributors
+            if contributor["author"]
+            and _contributed_in(contributor["weeks"], start, end)
+        }
+        print(f"{repo[:40]:40} Found {len(repo_contributor_names)} contributors")
+        contributor_names |= repo_contributor_names
+    return contributor_names, contributors_greater_than
+
+
+def _run_parallel(
+    func: Callable,
+    args_by_repo: Dict[str, Tuple],
+    max_workers: int,
+    parent: metrics.Span = None,
+    budget: int = 0,
+    cost: Callable[[str], int] = None,
+):
+    """
+    Generator that calls `func(repo, *args)` for all repos in a pool of worker
+    threads and yields `(repo, result)` as each call finishes.
+
+    Repos are started in the order of `args_by_repo`, with at most `max_workers`
+    running at the same time. Calls run inside the span `parent` (if given), so their
+    API calls add up there. With a `budget`, a repo is only started if its expected
+    API calls (`cost`) fit into what's left of the budget after the calls made so
+    far and the expected calls of the running repos. Otherwise, it waits for running
+    repos or, if there are none, is skipped (i.e. not yielded). The pool is shut down
+    without waiting if the generator is closed early.
+    """
+    max_workers = max(1, max_workers)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = deque(args_by_repo.items())
+    running = {}  # maps future to (repo, expected calls)
+
+    def start_next():
+        while pending and len(running) < max_workers:
+            repo, args = pending[0]
+            expected = cost(repo) if budget else 0
+            if budget:
+                reserved = sum(calls for _, calls in running.values())
+                if parent.api_calls + reserved + expected > budget:
+                    if running:
+                        return  # wait until a running repo is done
+                    pending.popleft()  # doesn't fit at all
+                    continue
+            pending.popleft()
+            if parent is not None:
+                future = executor.submit(metrics.call_in, parent, func, repo, *args)
             else:
-                raise RuntimeError()
-            # print()
-
-        # Count new stars on `page`.
-        new_stars = count_new(stargazers)
-
-        # Add all stars on the last page.
-        if page < num_pages:
-            new_stars += len(get_stargazers(num_pages))
+                future = executor.submit(func, repo, *args)
+            running[future] = (repo, expected)
 
-        # Add 100 stars for each page in between.
-        if page < num_pages - 1:
-            new_stars += (num_pages - 1 - page) * 100
-
-        print("Total new stars:", new_stars)
-        print()
-        return new_stars
+    try:
+        start_next()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            finished = [(running.pop(future)[0], future) for future in done]
+            start_next()  # before yielding, so the pool stays busy
+            for repo, future in finished:
+                yield repo, future.result()
+    finally:
+        for future in running:
+            future.cancel()
+        executor.shutdown(wait=False)
 
 
 class StatsMaker:
-    def __init__(self, username: str, year: int):
+    def __init__(self, username: str, year: int = None, periods: List[Period] = None):
         """
         Initializes an object, which queries and stores the Github stats for a user.
 
         This calls the cached functions above to query the API. Note that these
         functions cannot be included directly in this class because streamlit's
         caching mechanism wouldn't work properly then.
+
+        Args:
+            username (str): Github user or org.
+            year (int, optional): Year of the stats (e.g. for contributions). Needs
+                to overlap with at least one of the periods. Defaults to `None`, in
+                which case the year is derived from the periods (see `stats_year`).
+            periods (list of Period, optional): Periods to count new stars in (see
+                `year_period` and `parse_period`). All periods are counted from the
+                same scan of each repo. The first one is used for the top-level stats,
+                all of them are also returned under "periods" if there are several.
+                Defaults to `None`, in which case only `year` is counted.
         """
 
+        year = stats_year(year, periods)
         self.username = username
         self.year = year
+        self.periods = list(periods) if periods else [year_period(year)]
+        self._ranges = tuple((period.start, period.end) for period in self.periods)
 
         # Query some basic information for the user. Shouldn't take more than 1-3 s.
         (
             self.is_org,
             self.contributions,
             self.repos_contributed_to,
-            own_repo_stars,
-            external_repo_stars,
-        ) = _query_user(username, year)
+            own_repos,
+            external_repos,
+            repo_metadata,
+        ) = _query_user(username, year, self._ranges)
 
-        # Copy the returned dicts because streamlit doesn't allow mutating return
+        # Copy the returned dict because streamlit doesn't allow mutating return
         # values of cached functions.
-        self.own_repo_stars = copy.deepcopy(own_repo_stars)
-        self.external_repo_stars = copy.deepcopy(external_repo_stars)
+        self.repo_metadata = copy.deepcopy(repo_metadata)
+
+        # New stars per period for each repo (or None if the repo needs to be queried).
+        self.own_repo_stars = {
+            repo: self._initial_new_stars(repo) for repo in own_repos
+        }
+        self.external_repo_stars = {
+            repo: self._initial_new_stars(repo) for repo in external_repos
+        }
 
         # Make a list with the names of external repos.
         self.external_repos = list(self.external_repo_stars.keys())
 
-    def stream(self, include_external: List = None):
+        # Estimated new stars per period and per month for repos that were only
+        # sampled (see `_estimate_repo`).
+        self.star_estimates = {}
+        self.monthly_new_stars = {}
+
+        # Repos that weren't counted because the API budget ran out (see `stream`).
+        self.skipped = []
+
+        # Running totals and hottest repos of the counted repos for each period
+        # (filled in `stream`). For repos whose new stars are only estimated,
+        # `_bounds` holds the bounds relative to the estimate and `_slack` their sum
+        # in each period.
+        self._aggregators = [StarsAggregator() for _ in self.periods]
+        self._bounds = {}
+        self._slack = [[0, 0] for _ in self.periods]
+
+    def _initial_new_stars(self, repo: str) -> Union[Tuple[int, ...], None]:
+        """
+        Returns the new stars of a repo in each period if they are known from its
+        metadata, or None if the repo needs to be queried.
+        """
+        metadata = self.repo_metadata[repo]
+        new_stars = tuple(
+            _initial_new_stars(
+                metadata["stargazerCount"],
+                metadata["createdAt"],
+                period,
+                metadata.get("updatedAt"),
+            )
+            for period in self.periods
+        )
+        return None if None in new_stars else new_stars
+
+    def _use_graphql(self, repo: str) -> bool:
+        return self.repo_metadata[repo]["stargazerCount"] >= GRAPHQL_MIN_STARS
+
+    def _expected_calls(self, repo: str) -> int:
+        """Returns the expected API calls of `_query_repo` for a repo."""
+        return planner.expected_calls(
+            self.repo_metadata[repo], self._ranges, self._use_graphql(repo)
+        )
+
+    def prefetch_external(self, num_repos: int = None, mode: str = None) -> List[str]:
+        """
+        Starts counting the new stars of the top external repos in the background,
+        before the user selects them. Repos are prefetched one at a time in the
+        order returned by GraphQL (most contributions first) and only while the
+        quota stays above PREFETCH_QUOTA_FLOOR. If a repo is selected later, `stream`
+        picks up the result from the caches or waits for the running query (via
+        single-flight) instead of starting over.
+
+        Args:
+            num_repos (int, optional): Number of top external repos to prefetch.
+                Defaults to `None`, in which case PREFETCH_EXTERNAL is used.
+            mode (str, optional): Mode that the repos will be counted in (see
+                `stream`). Defaults to `None`, in which case STARS_MODE is used.
+
+        Returns:
+            list: Repos that were queued for prefetch.
+        """
+        if num_repos is None:
+            num_repos = PREFETCH_EXTERNAL
+        if mode is None:
+            mode = STARS_MODE
+
+        queued = []
+        for repo in self.external_repos[:num_repos]:
+            if self.external_repo_stars[repo] is not None:
+                continue  # known from the metadata
+            if mode == "exact":
+                func = _query_repo
+                args = (repo, self._ranges, self._use_graphql(repo))
+                resource = "graphql" if self._use_graphql(repo) else "core"
+                expected_calls = self._expected_calls(repo)
+            else:
+                # Refine mode estimates first, too.
+                func = _estimate_repo
+                stars = self.repo_metadata[repo]["stargazerCount"]
+                args = (repo, self._ranges, stars)
+                resource = "core"
+                expected_calls = APPROX_BUDGET
+            key = (mode, args)
+            if key in _prefetching:
+                continue
+            _prefetching.add(key)
+            _prefetch_executor.submit(
+                _prefetch, key, func, args, resource, expected_calls
+            )
+            queued.append(repo)
+        if queued:
+            print("Prefetching external repos:", ", ".join(queued))
+        return queued
+
+    def stream(
+        self,
+        include_external: List = None,
+        max_workers: int = None,
+        mode: str = None,
+        budget: int = None,
+    ):
         """
         Generator that calculates the stats and yields intermediate results.
 
+        Repos are queried in parallel by a pool of worker threads, likely-hot repos
+        first (see `planner.py`). Intermediate results are yielded as soon as each
+        repo finishes, i.e. in completion order.
+
         Args:
             include_external (list, optional): Names of external repos to include in
                 the count. A list of all external repos is contained in
-                `self. external_repos`. Defaults to `None`, in which case only the
-                user's own repos are counted.
+                `self. external_repos`, but other repos can be passed as well (repos
+                that don't exist are ignored). Defaults to `None`, in which case only
+                the user's own repos are counted.
+            max_workers (int, optional): Maximum number of repos to query at the
+                same time. Defaults to `None`, in which case `MAX_WORKERS` is used.
+            mode (str, optional): "exact", "approximate" or "refine" (see
+                STARS_MODE). While some repos are only estimated, the stats contain
+                `"approximate": True` and bounds of the new stars. Defaults to
+                `None`, in which case STARS_MODE is used.
+            budget (int, optional): Maximum number of API calls for the repos of
+                this user (0 for no limit). Once it's used up, no more repos are
+                queried and the stats contain `"lower_bound": True` and the number
+                of `"skipped_repos"`. Defaults to `None`, in which case
+                USER_API_BUDGET is used.
 
         Yields:
             (dict, float, str): Intermediate stats as a dict, the current progress
@@ -393,6 +1058,30 @@ class StatsMaker:
 
         if include_external is None:
             include_external = []
+        if max_workers is None:
+            max_workers = MAX_WORKERS
+        if mode is None:
+            mode = STARS_MODE
+        if mode not in ("exact", "approximate", "refine"):
+            raise ValueError(f"Unknown mode: {mode}")
+        if budget is None:
+            budget = USER_API_BUDGET
+
+        # API calls of all queries below add up in this span (it's not exported).
+        calls = metrics.Span("stream", {})
+
+        # Look up external repos that weren't returned by `_query_user` (e.g. passed
+        # in by the caller) with one batched query.
+        unknown = [
+            repo for repo in include_external if repo not in self.external_repo_stars
+        ]
+        if unknown:
+            for repo, metadata in query_repos_metadata(unknown).items():
+                self.repo_metadata[repo] = metadata
+                self.external_repo_stars[repo] = self._initial_new_stars(repo)
+            include_external = [
+                repo for repo in include_external if repo in self.external_repo_stars
+            ]
 
         # Construct list of all repos that need to be queried (i.e. all the ones
         # where we didn't evaluate the number of new stars yet).
@@ -402,67 +1091,240 @@ class StatsMaker:
         for repo in include_external:
             if self.external_repo_stars[repo] is None:
                 repos_to_query.append(repo)
+        repos_to_query = planner.plan(repos_to_query, self.repo_metadata, self._ranges)
+        self.skipped = []
 
-        def progress_msg(repo_idx):
-            try:
-                return f"Parsing repo: {repos_to_query[repo_idx]}"
-            except IndexError:
-                return "Finished"
+        # Aggregate the new stars of all counted repos incrementally, in the order of
+        # own repos first, then included external repos.
+        all_repo_stars = {
+            **self.own_repo_stars,
+            **{repo: self.external_repo_stars[repo] for repo in include_external},
+        }
+        positions = {repo: i for i, repo in enumerate(all_repo_stars)}
+        self._aggregators = [StarsAggregator() for _ in self.periods]
+        self._bounds = {}
+        self._slack = [[0, 0] for _ in self.periods]
+        for repo, new_stars in all_repo_stars.items():
+            self._aggregate(repo, positions[repo], new_stars)
 
         # Yield once in the beginning, to show already existing stats.
-        progress = 0.2 if repos_to_query else 1.0
-        yield self._compute_stats(include_external), progress, progress_msg(0)
-
-        # Perform the queries, store results and yield intermediate performance.
-        for i, repo in enumerate(repos_to_query):
-            # TODO: Maybe print in _query_repo instead.
-            # print(repo)
-            new_stars = _query_repo(repo, self.year)
-            # print()
-
-            if repo in self.own_repo_stars:
-                self.own_repo_stars[repo] = new_stars
-            elif repo in self.external_repo_stars:
-                self.external_repo_stars[repo] = new_stars
+        if repos_to_query:
+            progress = 0.2
+            msg = f"Parsing {len(repos_to_query)} repos"
+        else:
+            progress = 1.0
+            msg = "Finished"
+        yield self._compute_stats(), progress, msg
+
+        # Estimate the new stars of all repos from a few sampled pages first. Repos
+        # where the estimate turned out to be exact don't need to be searched.
+        if repos_to_query and mode in ("approximate", "refine"):
+            end_progress = 1.0 if mode == "approximate" else 0.5
+            with contextlib.closing(
+                _run_parallel(
+                    _estimate_repo,
+                    {
+                        repo: (
+                            self._ranges,
+                            self.repo_metadata[repo]["stargazerCount"],
+                        )
+                        for repo in repos_to_query
+                    },
+                    max_workers,
+                    calls,
+                    budget,
+                    lambda repo: APPROX_BUDGET,
+                )
+            ) as results:
+                for i, (repo, (estimates, histogram)) in enumerate(results):
+                    self.star_estimates[repo] = estimates
+                    self.monthly_new_stars[repo] = histogram
+                    new_stars = tuple(estimate.value for estimate in estimates)
+                    if all(estimate.low == estimate.high for estimate in estimates):
+                        self._store(repo, new_stars)
+                        self._aggregate(repo, positions[repo], new_stars)
+                    else:
+                        self._aggregate(repo, positions[repo], new_stars, estimates)
+
+                    progress = 0.2 + (end_progress - 0.2) * (i + 1) / len(
+                        repos_to_query
+                    )
+                    if i + 1 < len(repos_to_query):
+                        msg = f"Estimated repo: {repo} ({i + 1}/{len(repos_to_query)})"
+                    elif mode == "refine" and self._bounds:
+                        msg = f"Refining {len(self._bounds)} repos"
+                    else:
+                        msg = "Finished"
+                    yield self._compute_stats(), progress, msg
+            # Refine the estimates and count the repos that weren't estimated
+            # because the budget ran out (only if there's budget left).
+            counted = self._counted(repos_to_query)
+            if mode == "approximate":
+                self.skipped = [repo for repo in repos_to_query if repo not in counted]
+                repos_to_query = []
             else:
-                raise RuntimeError()
-
-            progress = min(1.0, 0.2 + 0.8 * (i + 1) / len(repos_to_query))
-            yield self._compute_stats(include_external), progress, progress_msg(i + 1)
+                repos_to_query = [
+                    repo
+                    for repo in repos_to_query
+                    if repo in self._bounds or repo not in counted
+                ]
+        else:
+            end_progress = 0.2
+
+        # Perform the queries in parallel, store results and yield intermediate
+        # performance as each repo finishes. The pool is shut down without waiting if
+        # the generator is closed early (e.g. on a streamlit rerun).
+        if repos_to_query:
+            # The REST API only returns the first 40k stargazers. Larger repos are
+            # counted through GraphQL, unless GRAPHQL_MIN_STARS is set higher. This
+            # checks the metadata, so it also warns if the counts are cached.
+            if any(
+                not self._use_graphql(repo)
+                and self.repo_metadata[repo]["stargazerCount"]
+                >= star_search.MAX_PAGE * 100
+                for repo in repos_to_query
+            ):
+                warnings.warn(
+                    "⚠️ You selected a repo with >40k stars. Due to a limitation in "
+                    "the Github API, it's not possible to count all new stars for "
+                    "this repo. The numbers below may be a bit off.",
+                    LargeRepoWarning,
+                )
+            with contextlib.closing(
+                _run_parallel(
+                    _query_repo,
+                    {
+                        repo: (self._ranges, self._use_graphql(repo))
+                        for repo in repos_to_query
+                    },
+                    max_workers,
+                    calls,
+                    budget,
+                    self._expected_calls,
+                )
+            ) as results:
+                for i, (repo, new_stars) in enumerate(results):
+                    self._store(repo, new_stars)
+                    self._aggregate(repo, positions[repo], new_stars)
+
+                    progress = min(
+                        1.0,
+                        end_progress
+                        + (1.0 - end_progress) * (i + 1) / len(repos_to_query),
+                    )
+                    if i + 1 < len(repos_to_query):
+                        msg = f"Parsed repo: {repo} ({i + 1}/{len(repos_to_query)})"
+                    else:
+                        msg = "Finished"
+                    yield self._compute_stats(), progress, msg
+            counted = self._counted(repos_to_query)
+            self.skipped = [
+                repo
+                for repo in repos_to_query
+                if repo not in counted and repo not in self._bounds
+            ]
+
+        # If the API budget ran out, the new stars of the skipped repos are missing.
+        if self.skipped:
+            msg = (
+                f"API budget of {budget} calls used up, {len(self.skipped)} repos "
+                "not counted"
+            )
+            print(msg)
+            yield self._compute_stats(), 1.0, msg
 
         # Yield stats one more time, in case no repo was queried changed above.
         # TODO: I think this is not required any more but check again.
-        # yield self._compute_stats(include_external), 1.0, "Finished"
+        # yield self._compute_stats(), 1.0, "Finished"
 
         print(f"Took {time.time() - start_time} s")
+        limits = rate_limit_info()
+        print(
+            "Remaining API calls: {core_remaining} core, {graphql_remaining} "
+            "GraphQL".format(**limits)
+        )
+        http_cache = get_client().http_cache
+        if http_cache is not None:
+            print(
+                "HTTP cache: {revalidated} of {conditional} conditional requests "
+                "revalidated".format(**http_cache.stats())
+            )
         print("-" * 80)
 
-    def _compute_stats(self, include_external: List):
-        """Computes intermediate statistics."""
-        # Compile all repos that should be included in the current count (i.e. are own
-        # repo or included external repo and have stars != None).
-        all_repo_stars = {
-            **self.own_repo_stars,
-            **{repo: self.external_repo_stars[repo] for repo in include_external},
+    def _counted(self, repos: List[str]) -> set:
+        """Returns the repos whose exact new stars are known or estimated."""
+        return {
+            repo
+            for repo in repos
+            if self.own_repo_stars.get(repo) is not None
+            or self.external_repo_stars.get(repo) is not None
+            or repo in self._bounds
         }
-        all_repo_stars = {k: v for k, v in all_repo_stars.items() if v is not None}
 
-        # Compute total number of new stars.
-        new_stars = sum(all_repo_stars.values())
+    def _store(self, repo: str, new_stars: Tuple[int, ...]) -> None:
+        """Stores the exact new stars of a repo, so it isn't queried again."""
+        if repo in self.own_repo_stars:
+            self.own_repo_stars[repo] = new_stars
+        elif repo in self.external_repo_stars:
+            self.external_repo_stars[repo] = new_stars
+        else:
+            raise RuntimeError()
+
+    def _aggregate(
+        self,
+        repo: str,
+        position: int,
+        new_stars: Union[Tuple[int, ...], None],
+        estimates: Tuple[star_search.Estimate, ...] = None,
+    ) -> None:
+        """
+        Adds the new stars of a repo in each period to the aggregators. If the new
+        stars are only estimated, their bounds are added to the bounds of the totals.
+        """
+        if new_stars is None:
+            return
+        for aggregator, period_stars in zip(self._aggregators, new_stars):
+            aggregator.set(repo, position, period_stars)
+
+        # Keep the sum of the differences between the bounds and the estimates, so
+        # the bounds of the totals can be computed without going through all repos.
+        old_bounds = self._bounds.pop(repo, None)
+        if old_bounds is not None:
+            for slack, (low, high) in zip(self._slack, old_bounds):
+                slack[0] -= low
+                slack[1] -= high
+        if estimates is not None:
+            self._bounds[repo] = tuple(
+                (estimate.low - estimate.value, estimate.high - estimate.value)
+                for estimate in estimates
+            )
+            for slack, (low, high) in zip(self._slack, self._bounds[repo]):
+                slack[0] += low
+                slack[1] += high
 
+    @staticmethod
+    def _hottest(aggregator: StarsAggregator) -> str:
+        """Returns the hottest repo of a period as text."""
         # Find hottest repo (= the one with the most new stars).
-        if new_stars > 0:
-            hottest_repo_stars = max(all_repo_stars.items(), key=lambda item: item[1])
-            hottest = f"{hottest_repo_stars[0]} (+{hottest_repo_stars[1]})"
-        elif len(all_repo_stars) > 0:
+        if aggregator.total > 0:
+            hottest_repo = aggregator.hottest()
+            return f"{hottest_repo} (+{aggregator.get(hottest_repo)})"
+        elif len(aggregator) > 0:
             # If no new stars, just choose the first repo (and do not display stars).
             # TODO: Choose repo with most stars overall. But need to save this somewhere
             #    above, otherwise it would mean a lot of API calls here (as this is
             #    called after each queried repo).
-            hottest = list(all_repo_stars.keys())[0]
+            return aggregator.first()
         else:
             # No repos at all.
-            hottest = "No repos yet :)"
+            return "No repos yet :)"
+
+    def _compute_stats(self):
+        """Computes intermediate statistics from the aggregated new stars."""
+        # Total number of new stars of all repos that were counted so far (in the
+        # first period).
+        new_stars = self._aggregators[0].total
+        hottest = self._hottest(self._aggregators[0])
 
         stats = {
             "username": self.username,
@@ -476,4 +1338,34 @@ class StatsMaker:
             "hottest": hottest,
             # "external_repos": external_repos,
         }
+        if self._bounds:
+            # Some repos are only estimated so far: The exact number of new stars is
+            # between these bounds.
+            stats["approximate"] = True
+            stats["new_stars_bounds"] = [
+                new_stars + self._slack[0][0],
+                new_stars + self._slack[0][1],
+            ]
+        if self.skipped:
+            # The API budget ran out before all repos were counted, so the new stars
+            # are only a lower bound (and there's no upper bound).
+            stats["lower_bound"] = True
+            stats["skipped_repos"] = len(self.skipped)
+            if self._bounds:
+                stats["new_stars_bounds"][1] = None
+        if len(self.periods) > 1:
+            stats["periods"] = {}
+            for period, aggregator, slack in zip(
+                self.periods, self._aggregators, self._slack
+            ):
+                period_stats = {
+                    "new_stars": aggregator.total,
+                    "hottest": self._hottest(aggregator),
+                }
+                if self._bounds:
+                    period_stats["new_stars_bounds"] = [
+                        aggregator.total + slack[0],
+                        None if self.skipped else aggregator.total + slack[1],
+                    ]
+                stats["periods"][period.label] = period_stats
         return stats
@@ -0,0 +1,156 @@
+"""
+HTTP cache for API responses with validators (ETag or Last-Modified), on disk.
+
+Github answers a conditional request (`If-None-Match` / `If-Modified-Since`) with 304
+Not Modified if the resource didn't change, and a 304 doesn't count against the rate
+limit. The client (see `github_client.py`) stores every successful response that has
+a validator, sends the validator along when it requests the same resource again and
+serves the stored body on a 304. This makes repeated requests for user objects, repo
+lists, contributor stats and the tail of stargazer lists free.
+
+A 304 comes without pagination headers, so the stored `Link` header would be served
+with it. That's only safe for the last page of a list: A full page doesn't change when
+items are appended to the list, but the number of pages does. Full pages are
+therefore always requested unconditionally.
+
+Only REST responses carry validators. GraphQL responses don't (Github doesn't
+support conditional GraphQL requests), so they pass through uncached.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, Union
+
+from multidict import CIMultiDict
+
+from cache import SQLiteStore
+
+
+# Stored response: validators, HTTP headers and parsed JSON body.
+CachedResponse = namedtuple(
+    "CachedResponse", ["etag", "last_modified", "headers", "data"]
+)
+
+
+class HTTPCache(SQLiteStore):
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, etag TEXT, "
+        "last_modified TEXT, headers TEXT, body TEXT, accessed REAL)"
+    ]
+
+    def __init__(self, directory: str, max_entries: int = 100000):
+        """
+        HTTP cache in `directory/http.sqlite`.
+
+        Args:
+            directory (str): Directory for the database (created if needed).
+            max_entries (int, optional): Maximum number of responses. The least
+                recently used ones are evicted. Defaults to 100000.
+        """
+        super().__init__(os.path.join(directory, "http.sqlite"))
+        self.max_entries = max_entries
+        self.conditional = 0  # requests sent with a validator
+        self.revalidated = 0  # ... that were answered with 304 Not Modified
+        self.stored = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(method: str, path: str, params: Dict, body: Dict) -> str:
+        return json.dumps([method, path, params or {}, body], sort_keys=True)
+
+    def get(self, key: str) -> Union[CachedResponse, None]:
+        """Returns the stored response for a request (or None)."""
+        row = (
+            self._connect()
+            .execute(
+                "SELECT etag, last_modified, headers, body FROM responses "
+                "WHERE key = ?",
+                (key,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        etag, last_modified, headers, body = row
+        return CachedResponse(
+            etag, last_modified, CIMultiDict(json.loads(headers)), json.loads(body)
+        )
+
+    @staticmethod
+    def validators(entry: CachedResponse, params: Dict = None) -> Dict:
+        """
+        Returns the headers that make a request for `entry` conditional. Empty if
+        `entry` is a full page of a paginated list (with query `params`), because its
+        pagination headers may be outdated even if its body isn't.
+        """
+        params = params or {}
+        if "page" in params and isinstance(entry.data, list):
+            if len(entry.data) >= int(params.get("per_page", 30)):
+                return {}
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def set(self, key: str, headers: CIMultiDict, data) -> None:
+        """Stores a response if it has a validator."""
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if etag is None and last_modified is None:
+            return
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                etag,
+                last_modified,
+                json.dumps(dict(headers)),
+                json.dumps(data),
+                time.time(),
+            ),
+        )
+        with self._lock:
+            self.stored += 1
+            evict = self.stored % 100 == 0
+        if evict:
+            self.evict()
+
+    def touch(self, key: str) -> None:
+        """Marks a stored response as used (for eviction)."""
+        self._connect().execute(
+            "UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key)
+        )
+
+    def count(self, revalidated: bool) -> None:
+        """Counts a conditional request and whether it was answered with 304."""
+        with self._lock:
+            self.conditional += 1
+            self.revalidated += revalidated
+
+    def evict(self) -> None:
+        """Removes the least recently used responses above the limit."""
+        self._connect().execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+            "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> Dict:
+        """Returns revalidation counters (of this process) and the number of entries."""
+        (entries,) = (
+            self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()
+        )
+        return {
+            "conditional": self.conditional,
+            "revalidated": self.revalidated,
+            "revalidation_rate": (
+                self.revalidated / self.conditional if self.conditional else 0.0
+            ),
+            "entries": entries,
+        }
@@ -0,0 +1,196 @@
+"""
+Background jobs that keep computing stats independently of the script run.
+
+Every widget interaction in streamlit (e.g. ticking an external repo or "Show more")
+reruns `main.py` from the top and abandons the `stream()` generator of the previous
+run. A job runs such a generator in a thread of its own instead and keeps its latest
+result. When the rerun asks for a job with the same key, it reattaches to the live
+job (or its final result) instead of starting over.
+
+Jobs can belong to a group (e.g. all jobs for one user). Starting a job cancels
+the other running jobs of its group, so changing the selection of external repos
+supersedes the job for the old selection instead of keeping both running. Work is
+still shared: Repos that are already searched by another job are coalesced via
+single-flight (see `singleflight.py`), finished repos are cached, and the stargazer
+pages of a search are checkpointed as they're fetched (see `stargazer_index.py`),
+so even an interrupted search continues where it stopped.
+
+Warnings issued while a job computes its updates are recorded on the job (instead of
+being printed), so every run that follows the job can show them.
+"""
+
+import threading
+import time
+import warnings
+from typing import Callable, Hashable, Iterator
+
+import config
+
+
+# Number of seconds that finished jobs are kept, so reruns can reattach to their
+# final results.
+JOB_MAX_AGE = float(config.get("JOB_MAX_AGE", 600))
+
+# Job that runs in the current thread (if any), see `_showwarning`.
+_local = threading.local()
+_default_showwarning = warnings.showwarning
+
+
+def _showwarning(message, category, filename, lineno, file=None, line=None):
+    """
+    Records warnings of job threads on their job and shows all others as usual.
+    Unlike `warnings.catch_warnings`, this is safe with several jobs at once.
+    """
+    job = getattr(_local, "job", None)
+    if job is None:
+        _default_showwarning(message, category, filename, lineno, file, line)
+    else:
+        job._warn(
+            warnings.WarningMessage(message, category, filename, lineno, file, line)
+        )
+
+
+warnings.showwarning = _showwarning
+
+
+class Job:
+    def __init__(
+        self, key: Hashable, target: Callable[[], Iterator], group: Hashable = None
+    ):
+        """
+        Job that iterates over the generator returned by `target()` in a daemon
+        thread. Call `start` to run it.
+
+        Args:
+            key (hashable): Key of the job, e.g. the arguments of the computation.
+            target (callable): Function that returns a generator of updates.
+            group (hashable, optional): Group of the job (see `JobManager.start`).
+                Defaults to None.
+        """
+        self.key = key
+        self.group = group
+        self.latest = None  # last update yielded by the generator
+        self.updates = 0  # number of updates so far
+        self.error = None  # exception raised by the generator (if any)
+        self.warnings = []  # warnings issued by the generator (`WarningMessage`s)
+        self.done = False
+        self.finished = None  # time when the job finished
+        self._target = target
+        self._cancelled = threading.Event()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """
+        Stops the job after its next update. Closing the generator stops queries
+        that haven't started yet, running ones finish (and are cached).
+        """
+        self._cancelled.set()
+
+    def _warn(self, message: warnings.WarningMessage) -> None:
+        with self._cond:
+            self.warnings.append(message)
+
+    def _run(self) -> None:
+        _local.job = self
+        generator = self._target()
+        try:
+            for update in generator:
+                with self._cond:
+                    self.latest = update
+                    self.updates += 1
+                    self._cond.notify_all()
+                if self.cancelled:
+                    print("Cancelled job:", self.key)
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            generator.close()
+            with self._cond:
+                self.done = True
+                self.finished = time.time()
+                self._cond.notify_all()
+
+    def follow(self) -> Iterator:
+        """
+        Generator that yields the latest update right away (if there's one) and then
+        every new update until the job is done. Updates that arrive while the caller
+        is busy are skipped, only the most recent one is yielded. Raises the
+        exception of the job if it failed.
+
+        `warnings` contains all warnings issued up to the yielded update, so they can
+        be shown along with it (also when reattaching to a job).
+
+        Closing the generator (e.g. when the streamlit script is rerun) only stops
+        following, the job itself keeps running.
+        """
+        seen = 0
+        while True:
+            with self._cond:
+                while self.updates == seen and not self.done:
+                    self._cond.wait()
+                latest, updates, done = self.latest, self.updates, self.done
+            if updates > seen:
+                seen = updates
+                yield latest
+            elif done:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class JobManager:
+    def __init__(self, max_age: float = None):
+        """
+        Keeps jobs by key (thread-safe).
+
+        Args:
+            max_age (float, optional): Number of seconds that finished jobs are kept.
+                Defaults to `None`, in which case JOB_MAX_AGE is used.
+        """
+        self.max_age = JOB_MAX_AGE if max_age is None else max_age
+        self.reattached = 0  # number of calls that reattached to an existing job
+        self._jobs = {}  # maps key to Job
+        self._lock = threading.Lock()
+
+    def start(
+        self, key: Hashable, target: Callable[[], Iterator], group: Hashable = None
+    ) -> Job:
+        """
+        Returns the job for `key`. If there's none (or the previous one failed or
+        was cancelled), a new job is started with `target` (see `Job`). All other
+        running jobs of the same `group` are cancelled.
+        """
+        with self._lock:
+            self._expire()
+            if group is not None:
+                for other in self._jobs.values():
+                    if other.group == group and other.key != key and not other.done:
+                        other.cancel()
+            job = self._jobs.get(key)
+            if job is not None and job.error is None and not job.cancelled:
+                self.reattached += 1
+                return job
+            job = self._jobs[key] = Job(key, target, group)
+        print("Starting job:", key)
+        job.start()
+        return job
+
+    def _expire(self) -> None:
+        """Removes jobs that finished more than `max_age` seconds ago."""
+        now = time.time()
+        for key, job in list(self._jobs.items()):
+            if job.done and now - job.finished > self.max_age:
+                del self._jobs[key]
+
+
+# Jobs of this process. Module globals survive streamlit reruns.
+manager = JobManager()
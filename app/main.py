@@ -4,21 +4,24 @@ Runs the streamlit app.
 
 import time
 from typing import List
-from socket import timeout
-from urllib.error import URLError
-from fastcore.net import HTTP403ForbiddenError
 import traceback
-import warnings
 
 import streamlit as st
 
+import github_client
 import github_reader
+import jobs
 import utils
 import templates
 
 
 # Set up page.
 st.set_page_config(page_title="Year on Github 2021", page_icon="🐙")
+
+# Cache queries in memory (in addition to the persistent cache in github_reader).
+github_reader.configure(
+    memoize=st.cache(hash_funcs=github_reader.HASH_FUNCS, show_spinner=False)
+)
 utils.local_css("static/local_styles.css")
 
 if "show_all_repos" not in st.session_state:
@@ -142,30 +145,44 @@ if username:
         )
         stats_maker = github_reader.StatsMaker(username, 2021)
 
+        # Start counting the stars of the top external repos in the background, so
+        # they're (partly) done when the user selects them below.
+        stats_maker.prefetch_external()
+
         # Show a checkbox for each external repo that the user contributed to.
         include_external = show_checkboxes_external(stats_maker.external_repos)
 
         # Stream stats from stats_maker, generate tweet from template and show it.
-        # The `stream` method is a generator which yields intermediate results.
-        with warnings.catch_warnings(record=True) as w:
-            for stats, progress, progress_msg in stats_maker.stream(include_external):
-                progress_bar.progress(progress)
-                progress_text.write(
-                    f'<p id="progress-text">{progress_msg}</p>', unsafe_allow_html=True
-                )
-
-                tweet_html = templates.tweet(stats)
-                tweet_box.write(tweet_html, unsafe_allow_html=True)
-
-                tweet_button_html = templates.tweet_button(tweet_html, username)
-                tweet_button.write(tweet_button_html, unsafe_allow_html=True)
-
-            # Print warning if any was catched.
-            if w:
-                error_box.warning(w[0].message)
-                print("=" * 80)
-                print(f"WARNING for user {username}:", w[0].message)
-                print("=" * 80)
+        # The `stream` method is a generator which yields intermediate results. It
+        # runs in a background job, so it continues when the script is rerun (e.g.
+        # after ticking a checkbox) and the rerun reattaches to it. A new selection of
+        # external repos supersedes the job for the old one.
+        job = jobs.manager.start(
+            (username, 2021, tuple(include_external)),
+            lambda: stats_maker.stream(include_external),
+            group=(username, 2021),
+        )
+        for stats, progress, progress_msg in job.follow():
+            progress_bar.progress(progress)
+            progress_text.write(
+                f'<p id="progress-text">{progress_msg}</p>', unsafe_allow_html=True
+            )
+
+            tweet_html = templates.tweet(stats)
+            tweet_box.write(tweet_html, unsafe_allow_html=True)
+
+            tweet_button_html = templates.tweet_button(tweet_html, username)
+            tweet_button.write(tweet_button_html, unsafe_allow_html=True)
+
+            # Show warning if the job issued any (they're recorded on the job, see
+            # `jobs.py`).
+            if job.warnings:
+                error_box.warning(job.warnings[0].message)
+
+        if job.warnings:
+            print("=" * 80)
+            print(f"WARNING for user {username}:", job.warnings[0].message)
+            print("=" * 80)
 
         progress_bar.empty()
         progress_text.empty()
@@ -181,7 +198,7 @@ if username:
             """
         )
         print_error(e)
-    except (timeout, URLError) as e:  # these are the same
+    except github_client.RequestTimeoutError as e:
         # Show an error message if there's a HTTP timeout. This can happen some time if
         # we made lots of API requests in a few minutes.
         error_box.error(
@@ -196,7 +213,7 @@ if username:
             """
         )
         print_error(e)
-    except HTTP403ForbiddenError as e:
+    except github_client.ForbiddenError as e:
         # Show an error message if we couldn't access the API - probably because we
         # reached the rate limit.
         error_box.error(
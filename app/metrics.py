@@ -0,0 +1,245 @@
+"""
+Lightweight tracing and metrics for queries and API calls.
+
+Code that should be measured runs inside a span, e.g.:
+
+    with metrics.span("http", method="GET", endpoint="/users/:name") as s:
+        ...
+        s.labels["status"] = "200"
+        s.bytes = len(body)
+
+Spans nest: API calls made inside a query span (also on the client's event loop,
+see `bind`) add their bytes and count to the query. Finished spans are aggregated
+into counters and histograms, which `render` exports in Prometheus' text format. If
+LOG_FORMAT is set to "json", every finished span is also printed as a JSON log line.
+"""
+
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Tuple
+
+import config
+
+
+LOG_JSON = config.get("LOG_FORMAT", "text") == "json"
+
+# Upper bounds of the histogram buckets for durations (in s) and API calls per span.
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CALLS_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Labels that are used for histograms. All other labels (e.g. status or token) are
+# only used for counters, to keep the number of series small.
+HISTOGRAM_LABELS = ("method", "endpoint", "query")
+
+
+class Span:
+    def __init__(self, name: str, labels: Dict, parent: "Span" = None):
+        """
+        A timed piece of work. `labels` are added to the exported metrics and should
+        only take a few different values. Details that are only needed in the logs
+        (e.g. the repo name) go into `info`.
+        """
+        self.name = name
+        self.labels = labels
+        self.info = {}
+        self.parent = parent
+        self.id = next(_ids)
+        self.api_calls = 0  # API calls made inside this span (incl. nested spans)
+        self.bytes = 0  # bytes received inside this span
+        self.duration = None
+        self._start = time.perf_counter()
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        """Aggregates finished spans into counters and histograms (thread-safe)."""
+        self.counters = defaultdict(float)  # maps (name, labels) to value
+        self.histograms = {}  # maps (name, labels) to Histogram
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, labels: Dict, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name, _freeze(labels)] += value
+
+    def observe(self, name: str, labels: Dict, value: float, buckets: Tuple) -> None:
+        key = (name, _freeze(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    def record(self, span: Span) -> None:
+        """Adds a finished span to the metrics (and its calls to its parents)."""
+        if span.name == "http":
+            with self._lock:
+                parent = span.parent
+                while parent is not None:
+                    parent.api_calls += 1
+                    parent.bytes += span.bytes
+                    parent = parent.parent
+
+        labels = {k: v for k, v in span.labels.items() if k in HISTOGRAM_LABELS}
+        self.inc(f"{span.name}_total", span.labels)
+        self.observe(
+            f"{span.name}_duration_seconds", labels, span.duration, DURATION_BUCKETS
+        )
+        if span.bytes:
+            self.inc(f"{span.name}_response_bytes_total", labels, span.bytes)
+        if span.name != "http":
+            self.observe(
+                f"{span.name}_api_calls", labels, span.api_calls, CALLS_BUCKETS
+            )
+
+    def render(self) -> str:
+        """Returns all metrics in Prometheus' text exposition format."""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (other, labels), value in sorted(self.counters.items()):
+                    if other == name:
+                        lines.append(f"{name}{_format(labels)} {value:g}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (other, labels), hist in sorted(self.histograms.items()):
+                    if other != name:
+                        continue
+                    bounds = [f"{bound:g}" for bound in hist.buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, itertools.accumulate(hist.counts)):
+                        bucket_labels = labels + (("le", bound),)
+                        lines.append(f"{name}_bucket{_format(bucket_labels)} {count}")
+                    lines.append(f"{name}_sum{_format(labels)} {hist.sum:g}")
+                    lines.append(f"{name}_count{_format(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _freeze(labels: Dict) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format(labels: Tuple) -> str:
+    """Formats labels as `{key="value",...}` (with escaped values)."""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+registry = Registry()
+_ids = itertools.count(1)
+_current = contextvars.ContextVar("span", default=None)
+
+
+@contextlib.contextmanager
+def span(name: str, **labels):
+    """Context manager that measures the code inside as a span (see `Span`)."""
+    s = Span(name, labels, parent=_current.get())
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.labels.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        s.duration = time.perf_counter() - s._start
+        registry.record(s)
+        if LOG_JSON:
+            _log(s)
+
+
+def annotate(**labels) -> None:
+    """Sets labels on the current span (does nothing outside of spans)."""
+    s = _current.get()
+    if s is not None:
+        s.labels.update(labels)
+
+
+def traced(name: str, **labels) -> Callable:
+    """Decorator that runs each call of a function in a span (with its args in info)."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            with span(name, **labels) as s:
+                s.info["args"] = args
+                return func(*args)
+
+        return wrapper
+
+    return decorator
+
+
+def bind(coro):
+    """
+    Returns a coroutine that runs `coro` inside the current span. Use this when the
+    coroutine runs on another thread's event loop, where the span isn't visible.
+    """
+    s = _current.get()
+    if s is None:
+        return coro
+
+    async def _bound():
+        _current.set(s)  # only affects the task that runs this coroutine
+        return await coro
+
+    return _bound()
+
+
+def call_in(parent: Span, func: Callable, *args):
+    """
+    Calls `func(*args)` inside the span `parent`, e.g. in a worker thread, where the
+    span isn't visible. API calls made by `func` are added to `parent`.
+    """
+    token = _current.set(parent)
+    try:
+        return func(*args)
+    finally:
+        _current.reset(token)
+
+
+def render() -> str:
+    """Returns all metrics in Prometheus' text exposition format."""
+    return registry.render()
+
+
+def _log(s: Span) -> None:
+    record = {
+        "ts": round(time.time(), 3),
+        "span": s.name,
+        "id": s.id,
+        "parent": s.parent.id if s.parent else None,
+        "duration_ms": round(1000 * s.duration, 1),
+        **s.labels,
+        **s.info,
+        "api_calls": s.api_calls,
+        "bytes": s.bytes,
+    }
+    print(json.dumps(record, default=str))
@@ -0,0 +1,71 @@
+"""
+Plans in which order the repos of a user are searched for new stars.
+
+Searching a repo costs API calls, and repos with many new stars matter most for the
+stats (they dominate the total and decide the hottest repo). The planner ranks repos
+by an upper estimate of their new stars, computed from the metadata `_query_user`
+already fetched: Assuming that a repo got its stars at a constant rate between its
+creation and its last update, the expected new stars in a period are the total
+stars times the share of this lifetime that falls into the period. Recently pushed
+repos come first on ties. Together with an API budget per user (see
+`StatsMaker.stream`), the likely-hot repos are searched before the budget runs out.
+The planner also predicts the API calls of each search, so a repo is only started if
+it fits into the remaining budget.
+"""
+
+import calendar
+import math
+import time
+from typing import Dict, List, Tuple
+
+
+def _epoch(timestamp: str) -> float:
+    return calendar.timegm(time.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ"))
+
+
+def expected_new_stars(metadata: Dict, ranges: Tuple[Tuple[str, str], ...]) -> float:
+    """
+    Returns the expected number of new stars of a repo in the time ranges
+    (`(start, end)` ISO 8601 timestamps), from its metadata alone.
+    """
+    created = _epoch(metadata["createdAt"])
+    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    updated = _epoch(metadata.get("updatedAt") or now)
+    lifetime = max(1.0, updated - created)
+    expected = 0.0
+    for start, end in ranges:
+        overlap = min(updated, _epoch(end)) - max(created, _epoch(start))
+        expected += metadata["stargazerCount"] * max(0.0, overlap) / lifetime
+    return expected
+
+
+def expected_calls(
+    metadata: Dict, ranges: Tuple[Tuple[str, str], ...], use_graphql: bool = False
+) -> int:
+    """
+    Returns the expected number of API calls to count the new stars of a repo in the
+    time ranges. A search on the REST API needs the first and last page and about
+    log2(pages) pages per range boundary. Reading stargazers newest first on the
+    GraphQL API needs one call per 100 stars after the earliest boundary.
+    """
+    if use_graphql:
+        earliest = min(start for start, _ in ranges)
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        return 1 + int(expected_new_stars(metadata, ((earliest, now),)) // 100)
+    num_pages = min(400, max(1, math.ceil(metadata["stargazerCount"] / 100)))
+    boundaries = len({boundary for time_range in ranges for boundary in time_range})
+    return 2 + boundaries * math.ceil(math.log2(num_pages))
+
+
+def plan(
+    repos: List[str], repo_metadata: Dict, ranges: Tuple[Tuple[str, str], ...]
+) -> List[str]:
+    """Returns the repos in the order they should be searched (likely-hot first)."""
+    return sorted(
+        repos,
+        key=lambda repo: (
+            expected_new_stars(repo_metadata[repo], ranges),
+            repo_metadata[repo].get("pushedAt") or "",
+        ),
+        reverse=True,
+    )
@@ -0,0 +1,188 @@
+"""
+Lightweight HTTP API for the stats engine (runs next to the streamlit app).
+
+Endpoints:
+
+    GET /stats/<username>   Final stats as JSON.
+    GET /stream/<username>  Server-Sent Events with the intermediate results of
+                            `StatsMaker.stream`, one `{"stats", "progress", "msg"}`
+                            event per step.
+    GET /metrics            Metrics of queries and API calls in Prometheus' text
+                            format (see `metrics.py`).
+
+Both accept the query parameters `year` (defaults to the year of the first period or
+2021), `external` (comma separated list of external repos to count), `all_external=1`
+(count all external repos the user contributed to) and `periods` (comma separated
+years or date ranges like `2021-03-01..2021-06-30` to count new stars in, see
+`StatsMaker`), `mode` (`exact`, `approximate` or `refine`, see `STARS_MODE`) and
+`budget` (maximum API calls for the user, see `USER_API_BUDGET`). The queries use
+the same caches as the app (if the same `CACHE_DIR` is configured), so requests for
+users that were already looked up are cheap.
+"""
+
+import json
+import re
+import traceback
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import github_client
+import github_reader
+import metrics
+
+
+def _parse_request(path: str) -> Tuple[str, str, Dict]:
+    """Splits a request path into endpoint, username and query parameters."""
+    url = urlparse(path)
+    params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    parts = url.path.strip("/").split("/")
+    if len(parts) != 2:
+        return "", "", params
+    return parts[0], parts[1], params
+
+
+# Full name of a repo as accepted in `external`.
+REPO_NAME = re.compile(r"^[\w.-]+/[\w.-]+$")
+
+
+def _error_status(e: Exception) -> HTTPStatus:
+    """Returns the HTTP status for an exception raised by the stats engine."""
+    if isinstance(e, github_reader.UserNotFoundError):
+        return HTTPStatus.NOT_FOUND
+    if not isinstance(e, github_client.GithubError):  # a bug, not the API
+        return HTTPStatus.INTERNAL_SERVER_ERROR
+    if isinstance(e, github_client.ForbiddenError):  # rate limits exhausted
+        return HTTPStatus.SERVICE_UNAVAILABLE
+    if isinstance(e, github_client.RequestTimeoutError):
+        return HTTPStatus.GATEWAY_TIMEOUT
+    return HTTPStatus.BAD_GATEWAY
+
+
+def _error(e: Exception) -> Dict:
+    """Returns the error response for an exception (unexpected ones are logged)."""
+    if _error_status(e) == HTTPStatus.INTERNAL_SERVER_ERROR:
+        traceback.print_exc()
+        return {"error": "Internal server error"}
+    return {"error": str(e)}
+
+
+class StatsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if urlparse(self.path).path == "/metrics":
+            self._send_metrics()
+            return
+        endpoint, username, params = _parse_request(self.path)
+        if endpoint not in ("stats", "stream") or not username:
+            self._send_json(
+                HTTPStatus.NOT_FOUND, {"error": "Use /stats/<user> or /stream/<user>"}
+            )
+            return
+        try:
+            periods = [
+                github_reader.parse_period(period)
+                for period in params.get("periods", "").split(",")
+                if period
+            ]
+        except ValueError:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "Invalid periods"})
+            return
+        try:
+            year = int(params["year"]) if "year" in params else None
+            year = github_reader.stats_year(year, periods)
+        except ValueError:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "Invalid year"})
+            return
+        mode = params.get("mode")
+        if mode not in (None, "exact", "approximate", "refine"):
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "Invalid mode"})
+            return
+        try:
+            budget = int(params["budget"]) if "budget" in params else None
+        except ValueError:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": "Invalid budget"})
+            return
+
+        external = [repo for repo in params.get("external", "").split(",") if repo]
+        invalid = [repo for repo in external if not REPO_NAME.match(repo)]
+        if invalid:
+            self._send_json(
+                HTTPStatus.BAD_REQUEST,
+                {"error": f"Invalid external repos (use owner/name): {invalid}"},
+            )
+            return
+
+        try:
+            stats_maker = github_reader.StatsMaker(username, year, periods=periods)
+        except Exception as e:
+            self._send_json(_error_status(e), _error(e))
+            return
+        if params.get("all_external") in ("1", "true"):
+            include_external = stats_maker.external_repos
+        else:
+            include_external = external
+        generator = stats_maker.stream(include_external, mode=mode, budget=budget)
+
+        if endpoint == "stats":
+            try:
+                for stats, _, _ in generator:
+                    pass
+            except Exception as e:
+                self._send_json(_error_status(e), _error(e))
+                return
+            self._send_json(HTTPStatus.OK, stats)
+        else:
+            self._send_events(generator)
+
+    def _send_json(self, status: HTTPStatus, data: Dict) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_metrics(self) -> None:
+        body = metrics.render().encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_events(self, generator) -> None:
+        """Streams the results of `StatsMaker.stream` as Server-Sent Events."""
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.close_connection = True  # the stream ends with the connection
+        try:
+            for stats, progress, msg in generator:
+                data = {"stats": stats, "progress": progress, "msg": msg}
+                self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"event: done\ndata: {}\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            print("Client disconnected, stopping stream")
+        except Exception as e:
+            data = {**_error(e), "status": _error_status(e).value}
+            self.wfile.write(f"event: error\ndata: {json.dumps(data)}\n\n".encode())
+        finally:
+            # Stops the pending repo queries if the client went away early.
+            generator.close()
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000) -> None:
+    """Runs the HTTP API until interrupted (each request runs in its own thread)."""
+    server = ThreadingHTTPServer((host, port), StatsHandler)
+    print(f"Serving stats API on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,76 @@
+"""
+Coalesces identical calls that are in flight at the same time.
+
+If several streamlit sessions ask for the same user or repo at once, `st.cache` and
+the persistent cache only help after the first call has finished. With single-flight,
+the first caller runs the computation and all concurrent callers with the same key
+wait for its result (or exception) instead of making the same API calls again.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Hashable
+
+import metrics
+
+
+class SingleFlight:
+    def __init__(self):
+        """Single-flight for blocking functions (thread-safe)."""
+        self.coalesced = 0  # number of calls that waited for another call
+        self._calls = {}  # maps key to Future of the call in flight
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable, *args):
+        """Runs `func(*args)`, unless a call with the same key is already running."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            metrics.annotate(cache="coalesced")
+            return future.result()
+
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def wrap(self, func: Callable) -> Callable:
+        """Decorator that coalesces calls with the same arguments."""
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            return self.do((func.__name__, args), func, *args)
+
+        return wrapper
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        """Single-flight for coroutines (all callers need to be on the same loop)."""
+        self.coalesced = 0
+        self._tasks = {}  # maps key to Task of the call in flight
+
+    async def do(self, key: Hashable, coro_func: Callable[[], Awaitable]):
+        """Awaits `coro_func()`, unless a call with the same key is already running."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(coro_func())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shield the task, so a cancelled caller doesn't cancel it for the others.
+        return await asyncio.shield(task)
@@ -0,0 +1,467 @@
+"""
+Search engines that find the year break in the list of stargazers of a repo.
+
+The Github API returns the stargazers of a repo sorted by the time they starred it
+(oldest first), split into pages of 100. All engines below find the number of stars
+that were given *before* a timestamp (e.g. the start of a year), so the number of new
+stars is the total number of stars minus this value. They work on a
+`StargazerPages` object, which fetches and memoizes pages and counts API calls.
+"""
+
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple, Union
+
+
+# One page of stargazers, as returned by the fetch function: The `starred_at`
+# timestamps (ISO 8601 strings, oldest first) and the number of the last page.
+Page = namedtuple("Page", ["starred_at", "last_page"])
+
+
+class StargazerPages:
+    def __init__(
+        self,
+        fetch_many: Callable[[List[Tuple[int, int]]], List[Page]],
+        per_page: int = 100,
+        on_fetch: Callable[["StargazerPages", List[int]], None] = None,
+    ):
+        """
+        Fetches pages of stargazers for one repo and memoizes them.
+
+        Args:
+            fetch_many (callable): Function that takes a list of `(page, per_page)`
+                tuples, retrieves all of them (ideally in parallel) and returns a
+                list of `Page` objects in the same order.
+            per_page (int, optional): Page size for regular pages. Defaults to 100.
+            on_fetch (callable, optional): Called with this object and the numbers of
+                the regular pages after each round-trip, e.g. to checkpoint them.
+                Defaults to None.
+        """
+        self._fetch_many = fetch_many
+        self._on_fetch = on_fetch
+        self.per_page = per_page
+        self.num_pages = None  # set when the first page is fetched
+        self.calls = 0  # number of API calls
+        self.rounds = 0  # number of round-trips (parallel calls count once)
+        self._pages = {}  # maps (page, per_page) to timestamps
+
+    def get(self, page: int, per_page: int = None) -> List[str]:
+        """Returns the `starred_at` timestamps on `page`."""
+        return self.get_many([page], per_page)[0]
+
+    def get_many(self, pages: List[int], per_page: int = None) -> List[List[str]]:
+        """Returns the `starred_at` timestamps on several pages, fetched in parallel."""
+        keys = [(page, per_page or self.per_page) for page in pages]
+        missing = [key for key in dict.fromkeys(keys) if key not in self._pages]
+        if missing:
+            self.calls += len(missing)
+            self.rounds += 1
+            results = self._fetch_many(missing)
+            for (page, per_page), result in zip(missing, results):
+                self._pages[(page, per_page)] = result.starred_at
+                if per_page == self.per_page:
+                    # The API only returns the last page if there's more than one
+                    # page and we're not on the last page already.
+                    if result.last_page:
+                        self.num_pages = result.last_page
+                    elif page == 1:
+                        self.num_pages = 1
+            if self._on_fetch is not None:
+                self._on_fetch(
+                    self, [page for page, size in missing if size == self.per_page]
+                )
+        return [self._pages[key] for key in keys]
+
+    def add(self, page: int, starred_at: List[str]) -> None:
+        """Adds a known page (e.g. from `stargazer_index`) without an API call."""
+        self._pages[(page, self.per_page)] = starred_at
+
+    def known_pages(self) -> Dict[int, List[str]]:
+        """Returns all pages of regular size that were fetched or added so far."""
+        return {
+            page: starred_at
+            for (page, per_page), starred_at in self._pages.items()
+            if per_page == self.per_page
+        }
+
+    @property
+    def total(self) -> int:
+        """Total number of stargazers (fetches the last page if required)."""
+        if self.num_pages is None:
+            self.get(1)
+        last = self.get(self.num_pages)
+        return (self.num_pages - 1) * self.per_page + len(last)
+
+    @property
+    def known_total(self) -> Union[int, None]:
+        """Total number of stargazers if the last page is known, otherwise None."""
+        if self.num_pages is None:
+            return None
+        last = self._pages.get((self.num_pages, self.per_page))
+        if last is None:
+            return None
+        return (self.num_pages - 1) * self.per_page + len(last)
+
+
+def count_before(starred_at: List[str], boundary: str) -> int:
+    """Returns the number of (sorted) timestamps that are before `boundary`."""
+    return bisect_left(starred_at, boundary)
+
+
+def _contains(starred_at: List[str], boundary: str) -> bool:
+    """Returns True if the break at `boundary` lies on the page."""
+    return bool(starred_at) and starred_at[0] < boundary <= starred_at[-1]
+
+
+def _stars_before_page(pages: StargazerPages, page: int, boundary: str) -> int:
+    """Returns the number of stars before `boundary`, if the break is on `page`."""
+    return (page - 1) * pages.per_page + count_before(pages.get(page), boundary)
+
+
+def binary_search(pages: StargazerPages, boundary: str) -> int:
+    """Returns the number of stars before `boundary` through binary search."""
+    first = pages.get(1)
+    if pages.num_pages == 1 or first[-1] >= boundary:
+        return count_before(first, boundary)
+
+    # Find the first page whose last star is on or after `boundary`. If there's no
+    # such page, this ends on the last page and all stars are before `boundary`.
+    # Start on 2nd page b/c we already searched the 1st one.
+    from_page = 2
+    to_page = pages.num_pages
+    while from_page < to_page:
+        page = (from_page + to_page) // 2
+        starred_at = pages.get(page)
+        if _contains(starred_at, boundary):
+            return _stars_before_page(pages, page, boundary)
+        elif starred_at[-1] >= boundary:
+            to_page = page
+        else:
+            from_page = page + 1
+    return _stars_before_page(pages, from_page, boundary)
+
+
+def kary_search(pages: StargazerPages, boundary: str, fanout: int = 4) -> int:
+    """
+    Returns the number of stars before `boundary` through k-ary search.
+
+    In each round, `fanout` pages are fetched in parallel, which splits the remaining
+    range into `fanout + 1` parts. This needs about log_(fanout + 1)(pages)
+    round-trips instead of log_2(pages), at the cost of more API calls. The last page
+    is fetched in parallel with the first round, because it's required for the total
+    number of stars anyway.
+    """
+    first = pages.get(1)
+    if pages.num_pages == 1 or first[-1] >= boundary:
+        return count_before(first, boundary)
+
+    # Same invariant as in `binary_search`: The break is on a page in
+    # [from_page, to_page] and all stars before `from_page` are before `boundary`.
+    from_page = 2
+    to_page = pages.num_pages
+    extra = [pages.num_pages]
+    while from_page < to_page:
+        span = to_page - from_page
+        if span <= fanout:
+            probes = list(range(from_page, to_page))
+        else:
+            probes = [
+                from_page + span * i // (fanout + 1) for i in range(1, fanout + 1)
+            ]
+            probes = list(dict.fromkeys(probes))
+        results = pages.get_many(probes + extra)[: len(probes)]
+        extra = []
+
+        for page, starred_at in zip(probes, results):
+            if _contains(starred_at, boundary):
+                return _stars_before_page(pages, page, boundary)
+        for page, starred_at in zip(probes, results):
+            if starred_at[-1] >= boundary:
+                to_page = page
+                break
+            from_page = page + 1
+    return _stars_before_page(pages, from_page, boundary)
+
+
+# The Github API only serves the first 400 pages of stargazers.
+MAX_PAGE = 400
+
+
+def _epoch(timestamp: str) -> float:
+    """Converts an ISO 8601 timestamp from the Github API to seconds since epoch."""
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+
+def _window(from_idx: int, to_idx: int, max_per_page: int) -> Union[Tuple, None]:
+    """
+    Returns the smallest page as `(page, per_page)` that contains all stars from
+    index `from_idx` to `to_idx` (0-based, inclusive), or None if there's no such
+    page. The API splits the list into pages of `per_page` items, so not every
+    window can be fetched with one call.
+    """
+    for per_page in range(max(1, to_idx - from_idx + 1), max_per_page + 1):
+        page = from_idx // per_page + 1
+        if to_idx // per_page + 1 == page and page <= MAX_PAGE:
+            return page, per_page
+    return None
+
+
+def interpolation_search(
+    pages: StargazerPages, boundary: str, max_per_page: int = 100
+) -> int:
+    """
+    Returns the number of stars before `boundary` through interpolation search.
+
+    The search keeps the two known stars closest to the break (one before, one
+    after `boundary`) and estimates the index of the break from the star rate
+    between them, assuming stars arrive at a constant rate. If an estimate doesn't
+    at least halve the unknown range, the next probe falls back to bisection. As
+    soon as the unknown range fits on a single page, that page is fetched with the
+    smallest possible `per_page`, which gives the exact index with a small download.
+    """
+    first = pages.get(1)
+    if pages.num_pages == 1 or first[-1] >= boundary:
+        return count_before(first, boundary)
+    last_offset = (pages.num_pages - 1) * pages.per_page
+    last = pages.get(pages.num_pages)
+    num_before = count_before(last, boundary)
+    if num_before > 0:  # break is on the last page or all stars are before it
+        return last_offset + num_before
+
+    # Index and timestamp (in s) of the last known star before and the first known
+    # star after the break.
+    lo_idx, lo_time = len(first) - 1, _epoch(first[-1])
+    hi_idx, hi_time = last_offset, _epoch(last[0])
+    boundary_time = _epoch(boundary)
+    bisect_next = False
+
+    while hi_idx - lo_idx > 1:
+        unknown = hi_idx - lo_idx - 1
+        window = _window(lo_idx + 1, hi_idx - 1, max_per_page)
+        if window is None:
+            if bisect_next or hi_time <= lo_time:
+                target = (lo_idx + hi_idx) // 2
+            else:
+                rate = (boundary_time - lo_time) / (hi_time - lo_time)
+                target = lo_idx + 1 + int(unknown * rate)
+                target = min(hi_idx - 1, max(lo_idx + 1, target))
+            window = (target // pages.per_page + 1, pages.per_page)
+
+        page, per_page = window
+        starred_at = pages.get(page, per_page)
+        offset = (page - 1) * per_page
+        num_before = count_before(starred_at, boundary)
+        if 0 < num_before < len(starred_at):
+            return offset + num_before
+        elif num_before == 0:
+            hi_idx, hi_time = offset, _epoch(starred_at[0])
+        else:
+            lo_idx, lo_time = offset + num_before - 1, _epoch(starred_at[-1])
+        bisect_next = hi_idx - lo_idx - 1 > unknown // 2
+
+    return hi_idx
+
+
+def count_descending(
+    fetch_desc: Callable[[Union[str, None]], Tuple[List[str], Union[str, None]]],
+    boundaries: List[str],
+) -> Tuple[List[int], int]:
+    """
+    Returns the number of stars on or after each of `boundaries` and the number of
+    API calls, by reading stargazers newest first until the earliest boundary is
+    crossed.
+
+    In contrast to the engines above, this doesn't need the total number of stars
+    and isn't limited to the first 400 pages, so the count is exact for huge repos.
+    Its cost scales with the number of stars after the earliest boundary though, not
+    the total.
+
+    Args:
+        fetch_desc (callable): Function that takes a cursor (None for the first
+            page) and returns the `starred_at` timestamps of the next page (newest
+            first) and the cursor for the page after it (None if it's the last).
+        boundaries (list): ISO 8601 timestamps.
+    """
+    earliest = min(boundaries)
+    stars_after = [0] * len(boundaries)
+    calls = 0
+    cursor = None
+    while True:
+        starred_at, cursor = fetch_desc(cursor)
+        calls += 1
+        for i, boundary in enumerate(boundaries):
+            stars_after[i] += sum(
+                1 for timestamp in starred_at if timestamp >= boundary
+            )
+        num_new = sum(1 for timestamp in starred_at if timestamp >= earliest)
+        if num_new < len(starred_at) or cursor is None:
+            return stars_after, calls
+
+
+# Estimated number of stars before a boundary. The exact number is always within
+# `low` and `high` (both inclusive), so the bounds can be summed over repos.
+Estimate = namedtuple("Estimate", ["value", "low", "high"])
+
+
+def estimate_before(
+    pages: StargazerPages, boundary: str, total: int, now: str
+) -> Estimate:
+    """
+    Estimates the number of stars before `boundary` from the pages that are known so
+    far, without any API calls.
+
+    If the break lies on a known page (or between two adjacent ones), the result is
+    exact. Otherwise, it's between the last known star before and the first known
+    star after `boundary`, and the estimate assumes that the stars in this gap
+    arrived at a constant rate. Stars after the last reachable page (see `MAX_PAGE`)
+    are assumed to lie between the last known star and `now`.
+
+    Args:
+        pages (StargazerPages): Stargazers with page 1 fetched.
+        boundary (str): ISO 8601 timestamp.
+        total (int): Total number of stars (e.g. from the repo's metadata).
+        now (str): Current time as ISO 8601 timestamp.
+    """
+    if total == 0 or boundary > now:
+        return Estimate(total, total, total)
+
+    # Index and timestamp of the last known star before and the first known star
+    # on or after the break (the end of the list counts as a star at `now`).
+    lo_idx, lo_time = -1, None
+    hi_idx, hi_time = total, now
+    for page, starred_at in pages.known_pages().items():
+        if not starred_at:
+            continue
+        offset = (page - 1) * pages.per_page
+        num_before = count_before(starred_at, boundary)
+        if 0 < num_before < len(starred_at):
+            exact = offset + num_before
+            return Estimate(exact, exact, exact)
+        elif num_before == 0 and offset < hi_idx:
+            hi_idx, hi_time = offset, starred_at[0]
+        elif num_before == len(starred_at) and offset + num_before - 1 > lo_idx:
+            lo_idx, lo_time = offset + num_before - 1, starred_at[-1]
+
+    if hi_idx - lo_idx <= 1 or lo_time is None:
+        return Estimate(hi_idx, hi_idx, hi_idx)
+    unknown = hi_idx - lo_idx - 1
+    rate = (_epoch(boundary) - _epoch(lo_time)) / max(
+        1.0, _epoch(hi_time) - _epoch(lo_time)
+    )
+    value = lo_idx + 1 + round(unknown * min(1.0, max(0.0, rate)))
+    return Estimate(value, lo_idx + 1, hi_idx)
+
+
+def sample(
+    pages: StargazerPages, boundaries: List[str], total: int, now: str, budget: int
+) -> List[Estimate]:
+    """
+    Estimates the number of stars before each boundary with at most `budget` API
+    calls (pages that are already known are free).
+
+    Page 1 comes first. Half of the remaining budget is then spread evenly over all
+    reachable pages (incl. the last one), fetched in parallel, to get the overall
+    shape of the star history. The rest goes to the gaps that contain a boundary: In
+    each round, the page at the estimated position of each unresolved boundary is
+    fetched, which narrows its bounds like an interpolation search would. See
+    `estimate_before` for the arguments, `total` is only used if the last page
+    can't be reached. At least 2 calls are always made (first and last page).
+    """
+    budget = max(2, budget)
+    start_calls = pages.calls
+    pages.get(1)
+    reachable = min(pages.num_pages, MAX_PAGE)
+
+    # Evenly spaced pages, which also includes the last reachable page.
+    num_spread = max(1, (budget - 1) // 2)
+    spread = [
+        1 + round((reachable - 1) * i / num_spread) for i in range(num_spread, 0, -1)
+    ]
+    missing = [page for page in dict.fromkeys(spread) if page > 1]
+    pages.get_many(missing[: max(0, budget - (pages.calls - start_calls))])
+    if pages.num_pages < MAX_PAGE:
+        total = pages.total  # the last page was fetched above
+
+    estimates = [estimate_before(pages, b, total, now) for b in boundaries]
+    while pages.calls - start_calls < budget:
+        probes = []
+        for estimate in estimates:
+            # First unknown star at or after the estimated break.
+            page = min(estimate.value, estimate.high - 1) // pages.per_page + 1
+            if estimate.low < estimate.high and page <= reachable:
+                probes.append(page)
+        known = pages.known_pages()
+        probes = [page for page in dict.fromkeys(probes) if page not in known]
+        if not probes:
+            break
+        pages.get_many(probes[: budget - (pages.calls - start_calls)])
+        estimates = [estimate_before(pages, b, total, now) for b in boundaries]
+    return estimates
+
+
+def monthly_histogram(
+    pages: StargazerPages, start: str, end: str, total: int, now: str
+) -> Dict[str, int]:
+    """
+    Returns the estimated number of new stars in each month (as "YYYY-MM") from
+    `start` to `end` (ISO 8601 timestamps, end exclusive), based on the pages that
+    are known so far (see `estimate_before`). Doesn't make any API calls.
+    """
+    year, month = int(start[:4]), int(start[5:7])
+    histogram = {}
+    while f"{year:04d}-{month:02d}-01T00:00:00Z" < end:
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        month_start = max(start, f"{year:04d}-{month:02d}-01T00:00:00Z")
+        month_end = min(end, f"{next_year:04d}-{next_month:02d}-01T00:00:00Z")
+        histogram[f"{year:04d}-{month:02d}"] = max(
+            0,
+            estimate_before(pages, month_end, total, now).value
+            - estimate_before(pages, month_start, total, now).value,
+        )
+        year, month = next_year, next_month
+    return histogram
+
+
+ENGINES = {
+    "binary": binary_search,
+    "kary": kary_search,
+    "interpolation": interpolation_search,
+}
+
+
+def simulate(
+    engine: Callable,
+    stars_before: List[int],
+    total: int,
+    count_total: bool = True,
+    **kwargs,
+) -> StargazerPages:
+    """
+    Runs `engine` on synthetic stargazers with the same breaks (one search per value
+    in `stars_before`, all sharing the fetched pages), e.g. to report how many API
+    calls another engine would have needed. If `count_total`, the last page is
+    fetched as well, as the real count does for periods that aren't over yet.
+    Doesn't make any API calls itself. Only works for engines that don't parse the
+    timestamps.
+    """
+
+    def fetch_many(requests):
+        num_pages = max(1, -(-total // 100))
+        results = []
+        for page, per_page in requests:
+            indices = range((page - 1) * per_page, min(total, page * per_page))
+            results.append(Page([_synthetic(i) for i in indices], num_pages))
+        return results
+
+    pages = StargazerPages(fetch_many)
+    for before in stars_before:
+        engine(pages, _synthetic(before), **kwargs)
+    if count_total:
+        pages.total
+    return pages
+
+
+def _synthetic(index: int) -> str:
+    """Timestamp of the star at `index` in `simulate` (sorts like the index)."""
+    return f"{index:012d}"
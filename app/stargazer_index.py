@@ -0,0 +1,149 @@
+"""
+Persistent index of the stargazer pages we already fetched for each repo.
+
+Stargazers are sorted by the time they starred a repo and new stars are only ever
+appended at the end, so full pages don't change (unless someone removes a star). The
+index stores every fetched page (with its first and last `starred_at`) and the number
+of pages per repo. Later searches on the same repo (for the same or a different year)
+can answer most probes from the index and only need to fetch the tail.
+
+Pages are checkpointed to the index as soon as they're fetched, not only when a
+search finishes. If a search is interrupted (e.g. the process is restarted), the
+next search of the repo starts from the pages that were already fetched.
+"""
+
+import json
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+from cache import SQLiteStore
+from star_search import Page, StargazerPages
+
+
+class StargazerIndex(SQLiteStore):
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS repos (repo TEXT PRIMARY KEY, num_pages INTEGER, "
+        "total INTEGER, updated REAL)",
+        "CREATE TABLE IF NOT EXISTS pages (repo TEXT, page INTEGER, first TEXT, "
+        "last TEXT, starred_at TEXT, PRIMARY KEY (repo, page))",
+    ]
+
+    def __init__(self, directory: str, max_age: float = 3600):
+        """
+        Index of stargazer pages in `directory/stargazers.sqlite`.
+
+        Args:
+            directory (str): Directory for the database (created if needed).
+            max_age (float, optional): Age (in s) after which the tail of a repo is
+                refreshed from the API. Defaults to 3600.
+        """
+        super().__init__(os.path.join(directory, "stargazers.sqlite"))
+        self.max_age = max_age
+
+    def load_pages(
+        self,
+        full_name: str,
+        fetch_many: Callable[[List[Tuple[int, int]]], List[Page]],
+    ) -> StargazerPages:
+        """
+        Returns a `StargazerPages` object for the repo, filled with all indexed pages.
+
+        If the index is older than `max_age`, the last indexed page is fetched again.
+        This also returns the current number of pages, so new tail pages are fetched
+        on demand. If that page changed in a way that's only possible when stars were
+        removed, the index for the repo is dropped.
+        """
+        pages = self._pages(full_name, fetch_many)
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT num_pages, updated FROM repos WHERE repo = ?", (full_name,)
+        ).fetchone()
+        if row is None:
+            return pages
+        num_pages, updated = row
+        indexed = {
+            page: json.loads(starred_at)
+            for page, starred_at in conn.execute(
+                "SELECT page, starred_at FROM pages WHERE repo = ?", (full_name,)
+            )
+        }
+
+        for page, starred_at in indexed.items():
+            if page != num_pages:
+                pages.add(page, starred_at)
+        if time.time() - updated < self.max_age and num_pages in indexed:
+            pages.add(num_pages, indexed[num_pages])
+            pages.num_pages = num_pages
+            return pages
+
+        # Refresh the tail. A full page must not change and the old last page may
+        # only have grown.
+        pages.num_pages = num_pages
+        tail = pages.get(num_pages)
+        old_tail = indexed.get(num_pages)
+        if old_tail is not None and tail[: len(old_tail)] != old_tail:
+            print(f"Stargazers of {full_name} changed, dropping index")
+            self.drop(full_name)
+            return self._pages(full_name, fetch_many)
+        return pages
+
+    def _pages(
+        self, full_name: str, fetch_many: Callable[[List[Tuple[int, int]]], List[Page]]
+    ) -> StargazerPages:
+        """Returns an empty `StargazerPages` object that checkpoints fetched pages."""
+        return StargazerPages(
+            fetch_many,
+            on_fetch=lambda pages, fetched: self.checkpoint(full_name, pages, fetched),
+        )
+
+    def checkpoint(
+        self, full_name: str, pages: StargazerPages, fetched: List[int]
+    ) -> None:
+        """
+        Stores the pages with the numbers in `fetched` in the index, without fetching
+        anything else (the total is only stored if the last page is known).
+        """
+        if pages.num_pages is None:
+            return
+        known = pages.known_pages()
+        self._write(
+            full_name,
+            pages.num_pages,
+            pages.known_total,
+            {page: known[page] for page in fetched if page in known},
+        )
+
+    def save(self, full_name: str, pages: StargazerPages) -> None:
+        """
+        Stores all pages of regular size from `pages` in the index (like
+        `checkpoint`, the total is only stored if the last page is known).
+        """
+        if pages.num_pages is None:
+            return
+        self._write(full_name, pages.num_pages, pages.known_total, pages.known_pages())
+
+    def _write(
+        self, full_name: str, num_pages: int, total: int, pages: Dict[int, List[str]]
+    ) -> None:
+        conn = self._connect()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+            [
+                (full_name, page, starred_at[0], starred_at[-1], json.dumps(starred_at))
+                for page, starred_at in pages.items()
+                if starred_at and page <= num_pages
+            ],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO repos VALUES (?, ?, ?, ?)",
+            (full_name, num_pages, total, time.time()),
+        )
+        conn.execute("COMMIT")
+
+    def drop(self, full_name: str) -> None:
+        """Removes a repo from the index."""
+        conn = self._connect()
+        conn.execute("DELETE FROM pages WHERE repo = ?", (full_name,))
+        conn.execute("DELETE FROM repos WHERE repo = ?", (full_name,))
@@ -34,12 +34,13 @@ Share yours 👉 <a href="http://gh.jrieke.com">gh.jrieke.com</a> | Built by <a
 
 
 def fineprint(runtime: Union[float, None] = None):
-    """Show rate limits and runtime of the last action as fineprint."""
+    """Show rate limits (pooled over all tokens) and runtime of the last action."""
     limits = github_reader.rate_limit_info()
     s = """
         <p align="right" id="fineprint">
-            Core: {core_remaining} (reset in {core_reset})<br>
-            GraphQL: {graphql_remaining} (reset in {graphql_reset})<br>
+            Core: {core_remaining} of {core_limit} (reset in {core_reset})<br>
+            GraphQL: {graphql_remaining} of {graphql_limit} (reset in {graphql_reset})<br>
+            Tokens: {core_available} of {num_tokens} available<br>
         """.format(
         **limits
     )
@@ -51,6 +52,12 @@ def fineprint(runtime: Union[float, None] = None):
 
 def tweet(stats: Dict) -> str:
     """Generate tweet html text based on `stats`."""
+    if stats.get("lower_bound"):
+        # The API budget ran out before all repos were counted.
+        stats = {**stats, "new_stars": f"≥{stats['new_stars']}"}
+    elif stats.get("approximate"):
+        # Some repos are only estimated so far (see `StatsMaker.stream`).
+        stats = {**stats, "new_stars": f"~{stats['new_stars']}"}
     if stats["is_org"]:
         tweet_html = ORG_TEMPLATE.format(**stats)
     else:
@@ -0,0 +1,167 @@
+"""
+Schedules API tokens based on their remaining quota.
+
+Github counts the rate limit per token and separately for the REST API ("core") and
+the GraphQL API ("graphql"). The scheduler tracks both from the `X-RateLimit-*`
+headers of each response and hands out the token with the most calls left.
+Exhausted tokens are parked until their quota resets.
+"""
+
+import threading
+import time
+from typing import Dict, List, Union
+
+
+# Quota that's assumed for tokens we didn't receive any headers for yet.
+DEFAULT_LIMIT = 5000
+
+
+class NoTokenAvailableError(Exception):
+    def __init__(self, resource: str, reset: float):
+        super().__init__(
+            f"All tokens are out of {resource} quota until "
+            f"{time.strftime('%H:%M:%S', time.localtime(reset))}"
+        )
+        self.resource = resource
+        self.reset = reset
+
+
+class _Quota:
+    def __init__(self):
+        self.limit = DEFAULT_LIMIT
+        self.remaining = DEFAULT_LIMIT
+        self.reset = 0.0  # epoch seconds, 0 if unknown
+        self.used = 0  # number of requests made with this token
+        self.parked_until = 0.0
+        self.observed = 0.0  # epoch seconds when the quota was last reported by Github
+
+
+class TokenScheduler:
+    def __init__(self, tokens: List[str]):
+        """
+        Hands out API tokens based on their remaining quota (thread-safe).
+
+        Args:
+            tokens (list): API tokens. If empty, `acquire` returns None, i.e.
+                requests are made without authentication.
+        """
+        self.tokens = list(tokens)
+        self._quotas = {}  # maps (token, resource) to _Quota
+        self._lock = threading.Lock()
+
+    def _quota(self, token: str, resource: str) -> _Quota:
+        key = (token, resource)
+        if key not in self._quotas:
+            self._quotas[key] = _Quota()
+        return self._quotas[key]
+
+    def acquire(self, resource: str = "core") -> Union[str, None]:
+        """
+        Returns the token with the most remaining calls for `resource`. Raises
+        `NoTokenAvailableError` if all tokens are parked.
+        """
+        if not self.tokens:
+            return None
+        now = time.time()
+        with self._lock:
+            available = []
+            for token in self.tokens:
+                quota = self._quota(token, resource)
+                if quota.parked_until > now:
+                    continue
+                if quota.reset and quota.reset <= now:
+                    # Quota was reset in the meantime, start from a full limit again.
+                    quota.remaining = quota.limit
+                    quota.reset = 0.0
+                available.append((quota.remaining, token))
+            if not available:
+                reset = min(
+                    self._quota(token, resource).parked_until for token in self.tokens
+                )
+                raise NoTokenAvailableError(resource, reset)
+
+            _, token = max(available)
+            quota = self._quota(token, resource)
+            # Count the call right away, so concurrent requests spread over tokens
+            # before the response headers come back.
+            quota.remaining = max(0, quota.remaining - 1)
+            quota.used += 1
+            return token
+
+    def update(self, token: str, resource: str, headers: Dict) -> None:
+        """Updates the quota of `token` from the `X-RateLimit-*` response headers."""
+        if token is None or "X-RateLimit-Remaining" not in headers:
+            return
+        resource = headers.get("X-RateLimit-Resource", resource)
+        with self._lock:
+            quota = self._quota(token, resource)
+            quota.remaining = int(headers["X-RateLimit-Remaining"])
+            quota.limit = int(headers.get("X-RateLimit-Limit", quota.limit))
+            quota.reset = float(headers.get("X-RateLimit-Reset", quota.reset))
+            quota.observed = time.time()
+            if quota.remaining == 0:
+                quota.parked_until = quota.reset
+                print(f"Parked token {mask(token)} ({resource}) until reset")
+
+    def park(self, token: str, resource: str, seconds: float) -> None:
+        """Parks `token` for some time, e.g. after hitting a secondary rate limit."""
+        if token is None:
+            return
+        with self._lock:
+            quota = self._quota(token, resource)
+            quota.parked_until = max(quota.parked_until, time.time() + seconds)
+        print(f"Parked token {mask(token)} ({resource}) for {seconds:.0f} s")
+
+    def set_quota(
+        self, token: str, resource: str, remaining: int, limit: int, reset: float
+    ) -> None:
+        """Sets the quota of `token` directly, e.g. from the `rate_limit` endpoint."""
+        with self._lock:
+            quota = self._quota(token, resource)
+            quota.remaining, quota.limit, quota.reset = remaining, limit, reset
+            quota.observed = time.time()
+            quota.parked_until = reset if remaining == 0 else 0.0
+
+    def usage(self) -> List[Dict]:
+        """Returns the quota and number of requests of each token and resource."""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "token": mask(token),
+                    "resource": resource,
+                    "remaining": quota.remaining,
+                    "limit": quota.limit,
+                    "reset": quota.reset,
+                    "used": quota.used,
+                    "parked": quota.parked_until > now,
+                }
+                for (token, resource), quota in sorted(self._quotas.items())
+            ]
+
+    def capacity(self, resource: str) -> Dict:
+        """
+        Returns the remaining calls for `resource`, summed over all tokens. This only
+        reads the quotas seen in earlier responses, so it doesn't cost any API calls.
+        `observed` is the time of the most recent quota report (0 if there's none).
+        """
+        now = time.time()
+        with self._lock:
+            quotas = [self._quota(token, resource) for token in self.tokens]
+            resets = [quota.reset for quota in quotas if quota.reset > now]
+            return {
+                "remaining": sum(
+                    quota.limit if 0 < quota.reset <= now else quota.remaining
+                    for quota in quotas
+                ),
+                "limit": sum(quota.limit for quota in quotas),
+                "reset": min(resets) if resets else now,
+                "available": sum(quota.parked_until <= now for quota in quotas),
+                "tokens": len(quotas),
+                "observed": max((quota.observed for quota in quotas), default=0.0),
+            }
+
+
+def mask(token: str) -> str:
+    """Shortens a token so it can be logged or shown."""
+    return "..." + token[-4:]
@@ -1,5 +1,4 @@
 import datetime
-import streamlit as st
 
 
 def format_timedelta(delta: datetime.timedelta) -> str:
@@ -26,6 +25,8 @@ def format_timedelta(delta: datetime.timedelta) -> str:
 
 def local_css(file_name: str) -> None:
     """Loads a local .css file into streamlit."""
+    import streamlit as st
+
     with open(file_name) as f:
         st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
 
@@ -0,0 +1,360 @@
+"""
+Fake Github API with synthetic users, orgs, repos and stargazers.
+
+Serves the REST and GraphQL endpoints the stats engine uses, with the same
+pagination, Link headers, 400-page limit for stargazers, 202 responses for
+contributor stats and rate limit headers as Github. All data is generated
+deterministically from a scenario (see `benchmarks/scenarios.py`), stargazers are
+only generated when a repo is requested for the first time.
+
+Run it on its own (e.g. to point the app at it via GH_API_URL):
+
+    python benchmarks/fake_github.py small-user --port 8765
+
+Besides the API, `GET /_bench` returns the number of requests per endpoint (incl.
+the number of 304 responses to conditional requests) and the expected result for
+the scenario's account.
+"""
+
+import argparse
+import asyncio
+import bisect
+import calendar
+import hashlib
+import json
+import random
+import re
+import time
+from collections import Counter
+from typing import Dict, List
+
+from aiohttp import web
+
+from scenarios import SCENARIOS
+
+
+def _epoch(date: str) -> int:
+    return calendar.timegm(time.strptime(date, "%Y-%m-%d"))
+
+
+def _iso(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+class Repo:
+    def __init__(self, full_name: str, created: int, num_stars: int, scenario: Dict):
+        self.full_name = full_name
+        self.created = created
+        self.num_stars = num_stars
+        self._scenario = scenario
+        self._stars = None
+
+    @property
+    def stars(self) -> List[int]:
+        """Sorted timestamps of all stars (generated on first use)."""
+        if self._stars is None:
+            rng = random.Random(f"{self._scenario['seed']}-{self.full_name}")
+            shape = self._scenario["star_shape"]
+            span = _epoch(self._scenario["now"]) - self.created
+            self._stars = sorted(
+                int(self.created + span * rng.random() ** shape)
+                for _ in range(self.num_stars)
+            )
+        return self._stars
+
+    def metadata(self) -> Dict:
+        # Like on Github, a repo is updated whenever it gets a star.
+        rng = random.Random(f"{self._scenario['seed']}-{self.full_name}-pushed")
+        pushed = rng.randint(self.created, _epoch(self._scenario["now"]))
+        return {
+            "nameWithOwner": self.full_name,
+            "createdAt": _iso(self.created),
+            "updatedAt": _iso(max([self.created, pushed] + self.stars[-1:])),
+            "pushedAt": _iso(pushed),
+            "stargazerCount": self.num_stars,
+        }
+
+    def contributors(self) -> List[Dict]:
+        """Weekly commit stats of the repo's contributors (like Github's API)."""
+        rng = random.Random(f"{self._scenario['seed']}-{self.full_name}-contributors")
+        first_week = self.created - self.created % (7 * 24 * 60 * 60)
+        weeks = range(first_week, _epoch(self._scenario["now"]), 7 * 24 * 60 * 60)
+        contributors = []
+        for i in range(rng.randint(1, self._scenario["max_contributors"])):
+            activity = rng.random()
+            contributors.append(
+                {
+                    "author": {"login": f"contributor-{i}"},
+                    "total": 0,
+                    "weeks": [
+                        {"w": w, "a": 0, "d": 0, "c": int(rng.random() < activity / 4)}
+                        for w in weeks
+                    ],
+                }
+            )
+        return contributors
+
+
+class FakeGithub:
+    def __init__(self, scenario: Dict):
+        """Generates the account and repos of a scenario and serves them."""
+        self.scenario = scenario
+        self.login = scenario["login"]
+        self.calls = Counter()  # number of requests per endpoint
+        self._rng = random.Random(scenario["seed"])
+        self._latency_rng = random.Random()
+        self._remaining = {}  # maps (token, resource) to remaining calls
+        self._stats_polls = Counter()  # contributor stats requests per repo
+
+        self.repos = {}
+        self.own_repos = self._make_repos(self.login, scenario["own_repos"])
+        self.external_repos = []
+        for i in range(scenario["external_repos"]):
+            self.external_repos += self._make_repos(f"someone-{i}", 1)
+        self.big_repos = []
+        for i in range(scenario["big_repos"]):
+            full_name = f"{self.login}/big-{i}"
+            created = _epoch(scenario["first_created"])
+            self.repos[full_name] = Repo(
+                full_name, created, scenario["big_repo_stars"], scenario
+            )
+            self.big_repos.append(full_name)
+        self.own_repos += self.big_repos
+
+    def _make_repos(self, owner: str, n: int) -> List[str]:
+        """Adds `n` repos with random creation dates and power-law star counts."""
+        first, last = _epoch(self.scenario["first_created"]), _epoch(
+            self.scenario["now"]
+        )
+        names = []
+        for i in range(n):
+            full_name = f"{owner}/repo-{i}"
+            created = self._rng.randint(first, last)
+            num_stars = min(
+                self.scenario["max_stars"],
+                int(
+                    self.scenario["star_scale"]
+                    * (self._rng.paretovariate(self.scenario["star_alpha"]) - 1)
+                ),
+            )
+            self.repos[full_name] = Repo(full_name, created, num_stars, self.scenario)
+            names.append(full_name)
+        return names
+
+    def expected_new_stars(self, year: int, include_external: bool = True) -> int:
+        """New stars the stats engine should find (stars during `year`)."""
+        start = calendar.timegm((year, 1, 1, 0, 0, 0))
+        end = calendar.timegm((year + 1, 1, 1, 0, 0, 0))
+        repos = self.own_repos + (self.external_repos if include_external else [])
+        return sum(
+            bisect.bisect_left(self.repos[name].stars, end)
+            - bisect.bisect_left(self.repos[name].stars, start)
+            for name in repos
+        )
+
+    # ---------------------------------------------------------------- HTTP handling
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/users/{login}", self.get_user)
+        app.router.add_get("/repos/{owner}/{name}/stargazers", self.list_stargazers)
+        app.router.add_get(
+            "/repos/{owner}/{name}/stats/contributors", self.get_contributors_stats
+        )
+        app.router.add_get("/rate_limit", self.rate_limit)
+        app.router.add_post("/graphql", self.graphql)
+        app.router.add_get("/_bench", self.bench_info)
+        return app
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        """Counts requests, adds latency and rate limit headers."""
+        if request.path == "/_bench":
+            return await handler(request)
+        endpoint = re.sub(r"^/repos/[^/]+/[^/]+", "/repos/:repo", request.path)
+        endpoint = re.sub(r"^/users/[^/]+", "/users/:name", endpoint)
+        self.calls[endpoint] += 1
+        latency = self.scenario["latency"]
+        await asyncio.sleep(latency * (0.5 + self._latency_rng.random()))
+
+        response = await handler(request)
+        resource = "graphql" if request.path == "/graphql" else "core"
+        key = (request.headers.get("Authorization"), resource)
+        self._remaining.setdefault(key, 5000)
+        if request.method == "GET" and response.status == 200:
+            # Like Github, answer conditional requests for unchanged resources with
+            # 304, which doesn't count against the rate limit.
+            etag = f'W/"{hashlib.sha1(response.body).hexdigest()}"'
+            if request.headers.get("If-None-Match") == etag:
+                self.calls["304"] += 1
+                response = web.Response(status=304)
+            else:
+                self._remaining[key] -= 1
+            response.headers["ETag"] = etag
+        else:
+            self._remaining[key] -= 1
+        response.headers["X-RateLimit-Limit"] = "5000"
+        response.headers["X-RateLimit-Remaining"] = str(max(0, self._remaining[key]))
+        response.headers["X-RateLimit-Reset"] = str(int(time.time()) + 3600)
+        response.headers["X-RateLimit-Resource"] = resource
+        return response
+
+    async def get_user(self, request):
+        login = request.match_info["login"]
+        if login != self.login:
+            return web.json_response({"message": "Not Found"}, status=404)
+        kind = "Organization" if self.scenario["kind"] == "org" else "User"
+        return web.json_response({"login": login, "type": kind})
+
+    async def list_stargazers(self, request):
+        full_name = f"{request.match_info['owner']}/{request.match_info['name']}"
+        if full_name not in self.repos:
+            return web.json_response({"message": "Not Found"}, status=404)
+        page = int(request.query.get("page", 1))
+        per_page = min(100, int(request.query.get("per_page", 30)))
+        if page > 400:
+            message = (
+                "In order to keep the API fast for everyone, pagination is limited"
+            )
+            return web.json_response({"message": message}, status=422)
+
+        stars = self.repos[full_name].stars
+        items = [
+            {"starred_at": _iso(t), "user": {"login": "stargazer"}}
+            for t in stars[(page - 1) * per_page : page * per_page]
+        ]
+        headers = {}
+        last = min(-(-len(stars) // per_page), 400)
+        if page < last:
+            url = f"{request.url.with_query({})}?per_page={per_page}"
+            headers["Link"] = (
+                f'<{url}&page={page + 1}>; rel="next", <{url}&page={last}>; rel="last"'
+            )
+        return web.json_response(items, headers=headers)
+
+    async def get_contributors_stats(self, request):
+        full_name = f"{request.match_info['owner']}/{request.match_info['name']}"
+        if full_name not in self.repos:
+            return web.json_response({"message": "Not Found"}, status=404)
+        self._stats_polls[full_name] += 1
+        if self._stats_polls[full_name] <= self.scenario["stats_pending_polls"]:
+            return web.json_response({}, status=202)
+        return web.json_response(self.repos[full_name].contributors())
+
+    async def rate_limit(self, request):
+        resources = {}
+        for resource in ["core", "graphql"]:
+            key = (request.headers.get("Authorization"), resource)
+            resources[resource] = {
+                "limit": 5000,
+                "remaining": self._remaining.get(key, 5000),
+                "reset": int(time.time()) + 3600,
+            }
+        return web.json_response({"resources": resources})
+
+    async def graphql(self, request):
+        body = await request.json()
+        query, variables = body["query"], body.get("variables") or {}
+        if "repositoryOwner" in query:
+            data = self._graphql_own_repos(variables)
+        elif "contributionsCollection" in query:
+            data = self._graphql_contributions(query)
+        elif "stargazers(" in query:
+            data = self._graphql_stargazers(variables)
+        else:
+            data = self._graphql_repos(query, variables)
+        return web.json_response({"data": data})
+
+    def _graphql_own_repos(self, variables: Dict) -> Dict:
+        names = sorted(self.own_repos) if variables["login"] == self.login else []
+        start = int(variables.get("cursor") or 0)
+        return {
+            "repositoryOwner": {
+                "repositories": {
+                    "nodes": [
+                        self.repos[name].metadata()
+                        for name in names[start : start + 100]
+                    ],
+                    "pageInfo": {
+                        "hasNextPage": start + 100 < len(names),
+                        "endCursor": str(start + 100),
+                    },
+                }
+            }
+        }
+
+    def _graphql_contributions(self, query: str) -> Dict:
+        rng = random.Random(self.scenario["seed"])
+        nodes = [
+            {
+                "repository": self.repos[name].metadata(),
+                "contributions": {"totalCount": len(self.external_repos) - i},
+            }
+            for i, name in enumerate(self.external_repos[:100])
+        ]
+        return {
+            "user": {
+                "contributionsCollection": {
+                    "contributionCalendar": {
+                        "totalContributions": rng.randint(0, 3000)
+                    },
+                    "totalRepositoriesWithContributedCommits": len(self.external_repos),
+                    "commitContributionsByRepository": nodes,
+                }
+            }
+        }
+
+    def _graphql_stargazers(self, variables: Dict) -> Dict:
+        full_name = f"{variables['owner']}/{variables['name']}"
+        stars = self.repos[full_name].stars
+        start = int(variables.get("cursor") or 0)
+        end = len(stars) - start
+        page = stars[max(0, end - 100) : end][::-1]  # newest first
+        return {
+            "repository": {
+                "stargazers": {
+                    "edges": [{"starredAt": _iso(t)} for t in page],
+                    "pageInfo": {
+                        "hasNextPage": start + 100 < len(stars),
+                        "endCursor": str(start + 100),
+                    },
+                }
+            }
+        }
+
+    def _graphql_repos(self, query: str, variables: Dict) -> Dict:
+        data = {}
+        pattern = r"(\w+): repository\(owner: \$(\w+), name: \$(\w+)\)"
+        for alias, owner, name in re.findall(pattern, query):
+            repo = self.repos.get(f"{variables[owner]}/{variables[name]}")
+            data[alias] = repo.metadata() if repo else None
+        return data
+
+    async def bench_info(self, request):
+        year = int(request.query.get("year", 2021))
+        return web.json_response(
+            {
+                "calls": dict(self.calls),
+                "expected_new_stars": self.expected_new_stars(year),
+            }
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--latency-scale", type=float, default=1.0, help="factor for the latency"
+    )
+    args = parser.parse_args()
+
+    scenario = dict(SCENARIOS[args.scenario])
+    scenario["latency"] *= args.latency_scale
+    fake = FakeGithub(scenario)
+    print(json.dumps({"login": fake.login, "port": args.port}), flush=True)
+    web.run_app(fake.app(), host="127.0.0.1", port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Benchmarks for the stats engine against a fake Github API.
+
+For each scenario (see `scenarios.py`), this starts the fake API in a separate
+process, runs `StatsMaker` end to end (incl. all external repos) with an empty cache
+and reports wall time, API calls and peak memory of the stats engine. Results are
+compared to the exact number of new stars of the synthetic account.
+
+    python benchmarks/run.py                      # all scenarios
+    python benchmarks/run.py small-user org --engine interpolation --repeat 2
+    python benchmarks/run.py --mode approximate
+    python benchmarks/run.py --budget 100
+
+With `--repeat`, the scenario is run again with the warm cache of the first run.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from collections import Counter
+from typing import Dict, List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "app"))
+
+import github_reader  # noqa: E402
+import star_search  # noqa: E402
+from cache import PersistentCache  # noqa: E402
+from github_client import GithubClient  # noqa: E402
+from http_cache import HTTPCache  # noqa: E402
+from scenarios import SCENARIOS  # noqa: E402
+from stargazer_index import StargazerIndex  # noqa: E402
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get_json(url: str) -> Dict:
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+
+def start_fake_github(scenario: str, latency_scale: float) -> subprocess.Popen:
+    """Starts the fake API for a scenario and returns the process once it's up."""
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(BENCHMARKS_DIR, "fake_github.py"),
+            scenario,
+            "--port",
+            str(port),
+            "--latency-scale",
+            str(latency_scale),
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    process.url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            _get_json(process.url + "/_bench")
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Fake Github API for {scenario} didn't start")
+
+
+def run_scenario(
+    url: str,
+    login: str,
+    year: int,
+    cache_dir: str,
+    mode: str = "exact",
+    budget: int = 0,
+) -> Dict:
+    """Runs `StatsMaker` against the fake API and measures it."""
+    calls_before = Counter(_get_json(url + "/_bench")["calls"])
+    client = GithubClient(
+        ["bench-token-1", "bench-token-2"],
+        base_url=url,
+        http_cache=HTTPCache(cache_dir),
+    )
+    github_reader.configure(
+        client=client,
+        persistent_cache=PersistentCache(cache_dir),
+        stargazer_index=StargazerIndex(cache_dir),
+    )
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    stats_maker = github_reader.StatsMaker(login, year)
+    for stats, _, _ in stats_maker.stream(
+        stats_maker.external_repos, mode=mode, budget=budget
+    ):
+        pass
+    wall_time = time.perf_counter() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    client.close()
+
+    bench = _get_json(f"{url}/_bench?year={year}")
+    calls = Counter(bench["calls"]) - calls_before
+    return {
+        "wall_time": wall_time,
+        "api_calls": sum(calls.values()) - calls["304"],
+        "revalidated_calls": calls["304"],
+        "calls_by_endpoint": dict(calls),
+        "peak_memory_mb": peak_memory / 2**20,
+        "new_stars": stats["new_stars"],
+        "new_stars_bounds": stats.get("new_stars_bounds"),
+        "lower_bound": stats.get("lower_bound", False),
+        "expected_new_stars": bench["expected_new_stars"],
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "scenarios", nargs="*", help=f"defaults to all: {', '.join(SCENARIOS)}"
+    )
+    parser.add_argument("--year", type=int, default=2021)
+    parser.add_argument(
+        "--engine",
+        choices=sorted(star_search.ENGINES),
+        default=github_reader.SEARCH_ENGINE,
+        help="search engine for the stargazers",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["exact", "approximate", "refine"],
+        default="exact",
+        help="how new stars are counted (see STARS_MODE)",
+    )
+    parser.add_argument(
+        "--budget", type=int, default=0, help="API calls per user (0 = no limit)"
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario")
+    parser.add_argument(
+        "--latency-scale", type=float, default=1.0, help="factor for the latency"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    github_reader.SEARCH_ENGINE = args.engine
+
+    results = []
+    for name in args.scenarios or sorted(SCENARIOS):
+        process = start_fake_github(name, args.latency_scale)
+        try:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                for run in range(args.repeat):
+                    # Logs of the stats engine go to stderr, so the table stays clean.
+                    with contextlib.redirect_stdout(sys.stderr):
+                        result = run_scenario(
+                            process.url,
+                            SCENARIOS[name]["login"],
+                            args.year,
+                            cache_dir,
+                            args.mode,
+                            args.budget,
+                        )
+                    result.update(
+                        scenario=name, run=run + 1, engine=args.engine, mode=args.mode
+                    )
+                    results.append(result)
+        finally:
+            process.kill()
+            process.wait()
+
+    print(
+        f"{'scenario':16} {'run':>3} {'time (s)':>9} {'API calls':>9} "
+        f"{'memory (MB)':>11} {'new stars':>10} {'exact':>5}"
+    )
+    for r in results:
+        exact = "yes" if r["new_stars"] == r["expected_new_stars"] else "no"
+        if r["new_stars_bounds"] and exact == "no":
+            # Approximate results are fine if the bounds contain the exact number.
+            low, high = r["new_stars_bounds"]
+            exact = "~" if low <= r["expected_new_stars"] <= high else "no"
+        if r["lower_bound"] and exact == "no":
+            exact = ">=" if r["new_stars"] <= r["expected_new_stars"] else "no"
+        print(
+            f"{r['scenario']:16} {r['run']:>3} {r['wall_time']:>9.2f} "
+            f"{r['api_calls']:>9} {r['peak_memory_mb']:>11.1f} "
+            f"{r['new_stars']:>10} {exact:>5}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
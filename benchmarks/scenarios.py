@@ -0,0 +1,55 @@
+"""
+Scenarios for the benchmarks. Each one describes a synthetic account on the fake
+Github API (see `fake_github.py`).
+
+Star counts of repos follow a power law: `star_scale * (pareto(star_alpha) - 1)`,
+capped at `max_stars`. Stars are spread between the creation of a repo and `now`,
+`star_shape` controls how: 1 spreads them evenly, values < 1 put more stars near
+`now` (growing repo), values > 1 put more stars near the creation (launch spike).
+"""
+
+DEFAULTS = {
+    "kind": "user",
+    "seed": 0,
+    "own_repos": 20,
+    "external_repos": 5,
+    "big_repos": 0,  # repos with `big_repo_stars` stars (counted through GraphQL)
+    "big_repo_stars": 60000,
+    "star_scale": 50,
+    "star_alpha": 1.2,
+    "max_stars": 30000,
+    "star_shape": 0.7,
+    "first_created": "2012-01-01",
+    "now": "2022-06-30",
+    "max_contributors": 10,  # per repo, only used for orgs
+    "stats_pending_polls": 0,  # 202 responses before contributor stats are ready
+    "latency": 0.05,  # mean latency per request in s
+}
+
+
+def _scenario(login: str, **kwargs) -> dict:
+    return {**DEFAULTS, "login": login, **kwargs}
+
+
+SCENARIOS = {
+    "small-user": _scenario("small-user", own_repos=10, external_repos=3),
+    "prolific-user": _scenario(
+        "prolific-user", own_repos=250, external_repos=40, star_scale=100
+    ),
+    "popular-user": _scenario(
+        "popular-user", own_repos=30, star_scale=2000, star_alpha=1.1, big_repos=1
+    ),
+    "launch-spikes": _scenario(
+        "launch-spikes", own_repos=40, star_scale=500, star_shape=4
+    ),
+    "org": _scenario(
+        "org", kind="org", own_repos=60, external_repos=0, max_contributors=30
+    ),
+    "org-cold-stats": _scenario(
+        "org-cold-stats",
+        kind="org",
+        own_repos=20,
+        external_repos=0,
+        stats_pending_polls=1,
+    ),
+}
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules in app/ import each other as top-level modules (see `app/__main__.py`).
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "app"))
@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+from aggregator import StarsAggregator
+from github_reader import StatsMaker
+
+
+def _compute_stats(repo_stars: dict) -> tuple:
+    """Total and hottest repo like the old `StatsMaker._compute_stats` did it."""
+    all_repo_stars = {k: v for k, v in repo_stars.items() if v is not None}
+    new_stars = sum(all_repo_stars.values())
+    if new_stars > 0:
+        hottest_repo_stars = max(all_repo_stars.items(), key=lambda item: item[1])
+        hottest = f"{hottest_repo_stars[0]} (+{hottest_repo_stars[1]})"
+    elif len(all_repo_stars) > 0:
+        hottest = list(all_repo_stars.keys())[0]
+    else:
+        hottest = "No repos yet :)"
+    return new_stars, hottest
+
+
+def test_empty():
+    aggregator = StarsAggregator()
+    assert aggregator.total == 0
+    assert len(aggregator) == 0
+    assert StatsMaker._hottest(aggregator) == "No repos yet :)"
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_matches_compute_stats(seed):
+    rng = random.Random(seed)
+    repos = [f"user/repo{i}" for i in range(rng.randint(1, 30))]
+    repo_stars = {repo: None for repo in repos}  # in the order of the repo list
+    aggregator = StarsAggregator()
+    for _ in range(rng.randint(1, 100)):
+        position = rng.randrange(len(repos))
+        # Few distinct values, so there are many ties (and often no stars at all).
+        new_stars = rng.choice([None, 0, 0, 1, 2, 3, rng.randint(0, 1000)])
+        if new_stars is not None:
+            repo_stars[repos[position]] = new_stars
+        aggregator.set(repos[position], position, new_stars)
+        assert (aggregator.total, StatsMaker._hottest(aggregator)) == _compute_stats(
+            repo_stars
+        )
@@ -0,0 +1,52 @@
+import json
+
+import batch
+import github_reader
+
+
+def test_read_checkpoint_missing_file(tmp_path):
+    assert batch.read_checkpoint(str(tmp_path / "stats.jsonl")) == set()
+
+
+def test_read_checkpoint_truncates_incomplete_line(tmp_path):
+    path = tmp_path / "stats.jsonl"
+    complete = "".join(
+        json.dumps({"username": username, "new_stars": 1}) + "\n"
+        for username in ["jrieke", "tiangolo", "streamlit"]
+    )
+    path.write_text(complete + '{"username": "half", "new_st', encoding="utf-8")
+
+    assert batch.read_checkpoint(str(path)) == {"jrieke", "tiangolo", "streamlit"}
+    assert path.read_text(encoding="utf-8") == complete
+
+    # Appending after the truncation gives valid JSON lines again.
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"username": "half"}) + "\n")
+    assert batch.read_checkpoint(str(path)) == {
+        "jrieke",
+        "tiangolo",
+        "streamlit",
+        "half",
+    }
+
+
+def test_failed_users_are_retried(tmp_path, monkeypatch):
+    def compute_stats(username, *args):
+        if username == "bot":
+            raise TypeError("'NoneType' object is not subscriptable")
+        if username == "ghost":
+            raise github_reader.UserNotFoundError(f"Couldn't find user: {username}")
+        return {"username": username, "new_stars": 1}
+
+    monkeypatch.setattr(batch, "compute_stats", compute_stats)
+    monkeypatch.setattr(batch, "_api_calls", lambda: 0)
+    monkeypatch.setattr(batch, "_revalidated", lambda: 0)
+    monkeypatch.setattr(github_reader, "configure", lambda **kwargs: None)
+    path = str(tmp_path / "stats.jsonl")
+
+    report = batch.run(["jrieke", "bot", "ghost", "tiangolo"], path, 2021)
+    assert (report["users"], report["failed"]) == (3, 1)
+    # Unknown users are done (with an error), failed ones are retried.
+    assert batch.read_checkpoint(path) == {"jrieke", "ghost", "tiangolo"}
+    report = batch.run(["jrieke", "bot", "ghost", "tiangolo"], path, 2021)
+    assert (report["users"], report["failed"], report["skipped"]) == (0, 1, 3)
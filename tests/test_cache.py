@@ -0,0 +1,106 @@
+import pytest
+
+import cache
+import github_reader
+from cache import PersistentCache
+
+
+class Clock:
+    """Stands in for the `time` module, so tests can move time forward."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def now(monkeypatch):
+    monkeypatch.setattr(github_reader, "_now", lambda: "2021-07-01T00:00:00Z")
+
+
+@pytest.mark.parametrize(
+    "args,ttl",
+    [
+        (("jrieke", 2020), None),
+        (("jrieke", 2021), github_reader.CACHE_TTL),
+        (("a/b", (("2020-01-01T00:00:00Z", "2021-01-01T00:00:00Z"),)), None),
+        (
+            (
+                "a/b",
+                (
+                    ("2020-01-01T00:00:00Z", "2021-01-01T00:00:00Z"),
+                    ("2021-01-01T00:00:00Z", "2021-06-01T00:00:00Z"),
+                ),
+            ),
+            None,
+        ),
+        (
+            ("a/b", (("2021-06-01T00:00:00Z", "2021-08-01T00:00:00Z"),)),
+            github_reader.CACHE_TTL,
+        ),
+        # `_query_user` for a past year, but its metadata is used for a later period.
+        (
+            ("jrieke", 2020, (("2021-01-01T00:00:00Z", "2022-01-01T00:00:00Z"),)),
+            github_reader.CACHE_TTL,
+        ),
+        (("jrieke", 2020, ()), None),
+        # Other third arguments (e.g. `use_graphql` of `_query_repo`) don't matter.
+        (("a/b", (("2020-01-01T00:00:00Z", "2021-01-01T00:00:00Z"),), True), None),
+    ],
+)
+def test_cache_ttl(now, args, ttl):
+    assert github_reader._cache_ttl(*args) == ttl
+
+
+def test_entries_expire(tmp_path, clock):
+    persistent_cache = PersistentCache(str(tmp_path))
+    persistent_cache.set("forever", 1)
+    persistent_cache.set("hour", 2, ttl=3600)
+    assert persistent_cache.get("hour") == (True, 2)
+
+    clock.now += 3601
+    assert persistent_cache.get("hour") == (False, None)
+    assert persistent_cache.get("forever") == (True, 1)
+    persistent_cache.evict()
+    assert persistent_cache.stats()["entries"] == 1
+    assert persistent_cache.stats()["hits"] == 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    persistent_cache = PersistentCache(str(tmp_path), max_entries=2)
+    for key in ["a", "b", "c"]:
+        persistent_cache.set(key, key)
+        clock.now += 1
+    persistent_cache.get("a")  # now used more recently than "b"
+    persistent_cache.evict()
+    assert persistent_cache.get("a") == (True, "a")
+    assert persistent_cache.get("b") == (False, None)
+    assert persistent_cache.get("c") == (True, "c")
+
+
+def test_memoize(tmp_path, clock):
+    persistent_cache = PersistentCache(str(tmp_path))
+    calls = []
+
+    def query(name, year):
+        calls.append(name)
+        return len(calls)
+
+    def ttl(name, year):
+        return 10 if year == 2021 else None
+
+    memoized = persistent_cache.memoize(ttl)(query)
+    assert [memoized("a", 2020), memoized("a", 2020), memoized("a", 2021)] == [1, 1, 2]
+    clock.now += 11
+    assert [memoized("a", 2020), memoized("a", 2021)] == [1, 3]
+    # A new version doesn't use the old entries.
+    assert persistent_cache.memoize(ttl, version=2)(query)("a", 2020) == 4
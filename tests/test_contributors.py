@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+from github_reader import WEEK, _contributed_in
+
+
+YEAR_START = 1609459200  # 2021-01-01
+YEAR_END = 1640995200 - 1  # last second of 2021
+
+
+def _weeks(first_week: int, num_weeks: int, rng: random.Random) -> list:
+    """Weekly contributor stats like the Github API returns them (`w` is a Sunday)."""
+    return [
+        {"w": first_week + i * WEEK, "a": 0, "d": 0, "c": rng.choice([0, 0, 0, 1, 5])}
+        for i in range(num_weeks)
+    ]
+
+
+def _brute_force(weeks: list, start: int, end: int) -> bool:
+    return any(week["c"] > 0 for week in weeks if start <= week["w"] <= end)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_contributed_in(seed):
+    rng = random.Random(seed)
+    # Repos created long before, during and after the year (the first Sunday of
+    # 2021 is Jan 3).
+    first_week = 1609632000 + WEEK * rng.randint(-300, 80)
+    weeks = _weeks(first_week, rng.randint(0, 400), rng)
+    expected = _brute_force(weeks, YEAR_START, YEAR_END)
+    assert _contributed_in(weeks, YEAR_START, YEAR_END) == expected
+
+
+def test_repo_created_after_the_year():
+    weeks = _weeks(YEAR_END + 3 * WEEK, 10, random.Random(0))
+    for week in weeks:
+        week["c"] = 1
+    assert not _contributed_in(weeks, YEAR_START, YEAR_END)
+
+
+def test_no_weeks():
+    assert not _contributed_in([], YEAR_START, YEAR_END)
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
+import pytest
+from aiohttp import web
+from multidict import CIMultiDict
+
+from github_client import GithubClient
+from http_cache import CachedResponse, HTTPCache
+from star_search import StargazerPages
+
+
+class StargazerServer:
+    def __init__(self, num_stars: int):
+        """
+        Stub server for the stargazers of one repo, which answers conditional
+        requests like Github (ETag of the body, 304 without `Link` header).
+        """
+        self.starred_at = []
+        self.add_stars(num_stars)
+        self.statuses = []  # HTTP status of each request
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self.url = asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    def add_stars(self, num_stars: int) -> None:
+        start = len(self.starred_at)
+        self.starred_at += [
+            time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1609459200 + i * 60))
+            for i in range(start, start + num_stars)
+        ]
+
+    async def _start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/repos/{owner}/{name}/stargazers", self._stargazers)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://127.0.0.1:{port}"
+
+    async def _stargazers(self, request):
+        page = int(request.query.get("page", 1))
+        per_page = int(request.query.get("per_page", 30))
+        num_pages = max(1, -(-len(self.starred_at) // per_page))
+        body = json.dumps(
+            [
+                {"starred_at": starred_at}
+                for starred_at in self.starred_at[(page - 1) * per_page :][:per_page]
+            ]
+        ).encode()
+        etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.statuses.append(304)
+            return web.Response(status=304, headers={"ETag": etag})
+        headers = {"ETag": etag, "Content-Type": "application/json"}
+        if page < num_pages:
+            headers["Link"] = (
+                f"<{self.url}{request.path}?per_page={per_page}&page={num_pages}>; "
+                'rel="last"'
+            )
+        self.statuses.append(200)
+        return web.Response(body=body, headers=headers)
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+@pytest.fixture
+def client(tmp_path):
+    def make_client(server):
+        client = GithubClient(
+            ["token"], base_url=server.url, http_cache=HTTPCache(str(tmp_path))
+        )
+        clients.append(client)
+        return client
+
+    clients = []
+    yield make_client
+    for client in clients:
+        client.close()
+
+
+def _total(client: GithubClient) -> int:
+    pages = StargazerPages(lambda requests: client.list_stargazers("a/b", requests))
+    return pages.total
+
+
+@pytest.mark.parametrize("num_stars,new_stars", [(200, 50), (100, 1), (150, 100)])
+def test_repo_grew_past_page_boundary(client, num_stars, new_stars):
+    server = StargazerServer(num_stars)
+    try:
+        assert _total(client(server)) == num_stars
+        server.add_stars(new_stars)
+        # A new client (e.g. the next process), so only the HTTP cache is shared.
+        assert _total(client(server)) == num_stars + new_stars
+    finally:
+        server.close()
+
+
+def test_unchanged_last_page_is_revalidated(client):
+    server = StargazerServer(150)
+    try:
+        assert _total(client(server)) == 150
+        server.statuses.clear()
+        github = client(server)
+        assert _total(github) == 150
+        # Page 1 is full, so it's requested again, the last page is answered by 304.
+        assert server.statuses == [200, 304]
+        assert github.http_cache.revalidated == 1
+    finally:
+        server.close()
+
+
+def test_validators():
+    entry = CachedResponse('W/"1"', "Fri, 01 Jan 2021 00:00:00 GMT", {}, [1, 2])
+    assert HTTPCache.validators(entry) == {
+        "If-None-Match": 'W/"1"',
+        "If-Modified-Since": "Fri, 01 Jan 2021 00:00:00 GMT",
+    }
+    # Full pages of paginated lists aren't revalidated, other pages are.
+    assert HTTPCache.validators(entry, {"page": 1, "per_page": 2}) == {}
+    assert HTTPCache.validators(entry, {"page": 2, "per_page": 3}) != {}
+    entry = CachedResponse('W/"1"', None, {}, list(range(30)))
+    assert HTTPCache.validators(entry, {"page": 1}) == {}  # Github's default is 30
+    assert HTTPCache.validators(entry, {"per_page": 30}) == {"If-None-Match": 'W/"1"'}
+
+
+def test_store_and_evict(tmp_path):
+    http_cache = HTTPCache(str(tmp_path), max_entries=2)
+    http_cache.set("unvalidated", CIMultiDict(), {"a": 1})
+    assert http_cache.get("unvalidated") is None
+
+    for i in range(3):
+        http_cache.set(f"key{i}", CIMultiDict({"ETag": f'W/"{i}"'}), [i])
+        time.sleep(0.01)
+    assert http_cache.get("key1") == CachedResponse(
+        'W/"1"', None, {"ETag": 'W/"1"'}, [1]
+    )
+    http_cache.touch("key0")
+    http_cache.evict()
+    assert http_cache.get("key0") is not None
+    assert http_cache.get("key1") is None
+    assert http_cache.get("key2") is not None
+    assert http_cache.stats()["entries"] == 2
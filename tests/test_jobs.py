@@ -0,0 +1,109 @@
+import threading
+import warnings
+
+import pytest
+
+import jobs
+from jobs import JobManager
+
+
+@pytest.fixture(autouse=True)
+def record_job_warnings(monkeypatch):
+    # pytest records warnings itself, so route them through the jobs hook again.
+    monkeypatch.setattr(warnings, "showwarning", jobs._showwarning)
+
+
+def _updates(*updates):
+    yield from updates
+
+
+def _warning_job(name: str, barrier: threading.Barrier):
+    """Generator that warns while the other job is running."""
+    barrier.wait(timeout=5)
+    warnings.warn(f"warning of {name}")
+    yield 1
+    barrier.wait(timeout=5)
+    yield 2
+
+
+def test_warnings_are_recorded_per_job():
+    manager = JobManager()
+    barrier = threading.Barrier(2)
+    names = ["a", "b"]
+    started = [
+        manager.start(name, lambda name=name: _warning_job(name, barrier))
+        for name in names
+    ]
+    for job, name in zip(started, names):
+        assert list(job.follow())[-1] == 2
+        assert [str(w.message) for w in job.warnings] == [f"warning of {name}"]
+
+    # A rerun that reattaches to the finished job still sees its warnings.
+    job = manager.start("a", lambda: _updates())
+    assert job is started[0]
+    assert [str(w.message) for w in job.warnings] == ["warning of a"]
+
+
+def _counter(stop: threading.Event):
+    """Generator that counts until `stop` is set."""
+    i = 0
+    while not stop.wait(0.001):
+        i += 1
+        yield i
+
+
+def test_rerun_reattaches_to_running_job():
+    manager = JobManager()
+    stop = threading.Event()
+    job = manager.start("a", lambda: _counter(stop))
+    following = job.follow()
+    first = next(following)
+    following.close()  # e.g. the script was rerun, the job keeps running
+
+    assert manager.start("a", lambda: _updates()) is job
+    assert manager.reattached == 1
+    assert next(job.follow()) >= first
+    stop.set()
+    assert list(job.follow())[-1] == job.latest
+    assert not job.cancelled and job.error is None
+
+
+def test_new_job_supersedes_others_of_its_group():
+    manager = JobManager()
+    stop = threading.Event()
+    old = manager.start(("a", ()), lambda: _counter(stop), group="a")
+    other_user = manager.start(("b", ()), lambda: _counter(stop), group="b")
+    new = manager.start(("a", ("x/y",)), lambda: _updates(1, 2), group="a")
+
+    assert list(new.follow())[-1] == 2
+    list(old.follow())  # returns once the cancelled job stopped
+    assert old.cancelled and old.done
+    assert not other_user.cancelled
+
+    # Going back to the old selection restarts the cancelled job.
+    restarted = manager.start(("a", ()), lambda: _updates(3), group="a")
+    assert restarted is not old
+    assert list(restarted.follow())[-1] == 3
+    stop.set()
+    list(other_user.follow())
+
+
+def test_failed_job_is_restarted():
+    def fail():
+        raise ValueError("boom")
+        yield
+
+    manager = JobManager()
+    job = manager.start("a", fail)
+    with pytest.raises(ValueError):
+        list(job.follow())
+    restarted = manager.start("a", lambda: _updates(1))
+    assert restarted is not job
+    assert list(restarted.follow()) == [1]
+
+
+def test_finished_jobs_expire():
+    manager = JobManager(max_age=0)
+    job = manager.start("a", lambda: _updates(1))
+    list(job.follow())
+    assert manager.start("a", lambda: _updates(2)) is not job
@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+NUM_CALLERS = 8
+
+
+def _call_concurrently(flight: SingleFlight, func) -> list:
+    """Calls `func` via `flight` from several threads with the same key."""
+    with ThreadPoolExecutor(NUM_CALLERS) as executor:
+        futures = [executor.submit(flight.do, "key", func) for _ in range(NUM_CALLERS)]
+        return [future.exception() or future.result() for future in futures]
+
+
+def _until_coalesced(flight: SingleFlight) -> None:
+    """Blocks the leader until all other callers are waiting for it."""
+    while flight.coalesced < NUM_CALLERS - 1:
+        threading.Event().wait(0.001)
+
+
+def test_concurrent_calls_run_once():
+    flight = SingleFlight()
+    calls = []
+
+    def func():
+        calls.append(1)
+        _until_coalesced(flight)
+        return object()
+
+    results = _call_concurrently(flight, func)
+    assert len(calls) == 1
+    assert flight.coalesced == NUM_CALLERS - 1
+    assert all(result is results[0] for result in results)
+
+
+def test_exception_is_raised_for_all_callers():
+    flight = SingleFlight()
+
+    def func():
+        _until_coalesced(flight)
+        raise ValueError("boom")
+
+    results = _call_concurrently(flight, func)
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_sequential_and_different_keys_run_separately():
+    flight = SingleFlight()
+    calls = []
+    square = flight.wrap(lambda x: calls.append(x) or x * x)
+    assert [square(2), square(2), square(3)] == [4, 4, 9]
+    assert calls == [2, 2, 3]
+    assert flight.coalesced == 0
+
+
+def test_key_is_released_after_exception():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("key", int, "not a number")
+    assert flight.do("key", int, "42") == 42
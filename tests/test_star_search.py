@@ -0,0 +1,136 @@
+import math
+import random
+import time
+
+import pytest
+
+import star_search
+from star_search import Page, StargazerPages
+
+
+def _timestamps(rng: random.Random, num_stars: int) -> list:
+    """Returns sorted random `starred_at` timestamps (with some duplicates)."""
+    start = 1262304000  # 2010-01-01
+    times = sorted(
+        rng.randint(start, start + 12 * 365 * 86400) for _ in range(num_stars)
+    )
+    for i in range(1, len(times)):
+        if rng.random() < 0.05:
+            times[i] = times[i - 1]
+    return [time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t)) for t in times]
+
+
+def _pages(starred_at: list) -> StargazerPages:
+    """Returns pages that are served from `starred_at` like the Github API does."""
+
+    def fetch_many(requests):
+        results = []
+        for page, per_page in requests:
+            num_pages = max(1, math.ceil(len(starred_at) / per_page))
+            # Github only sends the `last` link if there's more than one page and
+            # the requested page isn't the last one.
+            last_page = num_pages if page < num_pages else 0
+            results.append(
+                Page(starred_at[(page - 1) * per_page : page * per_page], last_page)
+            )
+        return results
+
+    return StargazerPages(fetch_many)
+
+
+def _boundaries(rng: random.Random, starred_at: list) -> list:
+    boundaries = ["2000-01-01T00:00:00Z", "2030-01-01T00:00:00Z"]
+    if starred_at:
+        boundaries += rng.sample(starred_at, min(5, len(starred_at)))
+    boundaries += _timestamps(rng, 5)
+    return boundaries
+
+
+@pytest.mark.parametrize("engine", sorted(star_search.ENGINES))
+@pytest.mark.parametrize("seed", range(40))
+def test_engines_are_exact(engine, seed):
+    rng = random.Random(seed)
+    num_stars = rng.choice([0, 1, 99, 100, 101, rng.randint(0, 5000)])
+    starred_at = _timestamps(rng, num_stars)
+    for boundary in _boundaries(rng, starred_at):
+        pages = _pages(starred_at)
+        expected = star_search.count_before(starred_at, boundary)
+        assert star_search.ENGINES[engine](pages, boundary) == expected
+
+
+@pytest.mark.parametrize("fanout", [1, 2, 4, 7])
+def test_kary_search_with_any_fanout(fanout):
+    rng = random.Random(fanout)
+    starred_at = _timestamps(rng, 3456)
+    for boundary in _boundaries(rng, starred_at):
+        pages = _pages(starred_at)
+        expected = star_search.count_before(starred_at, boundary)
+        assert star_search.kary_search(pages, boundary, fanout=fanout) == expected
+
+
+def test_repeated_search_fetches_no_new_pages():
+    rng = random.Random(0)
+    starred_at = _timestamps(rng, 2500)
+    pages = _pages(starred_at)
+    for boundary in _boundaries(rng, starred_at):
+        expected = star_search.count_before(starred_at, boundary)
+        assert star_search.binary_search(pages, boundary) == expected
+        calls = pages.calls
+        assert star_search.binary_search(pages, boundary) == expected
+        assert pages.calls == calls
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_simulate_matches_real_calls(seed):
+    rng = random.Random(seed)
+    starred_at = _timestamps(rng, rng.randint(1, 5000))
+    boundaries = sorted(set(_boundaries(rng, starred_at)))[:3]
+    pages = _pages(starred_at)
+    stars_before = [star_search.binary_search(pages, b) for b in boundaries]
+    # Like `_query_repo`, only use the total if the search fetched the last page.
+    total = pages.known_total or pages.num_pages * pages.per_page
+    simulated = star_search.simulate(
+        star_search.binary_search, stars_before, total, count_total=False
+    )
+    assert simulated.calls == pages.calls
+
+
+def test_known_total_does_not_fetch():
+    starred_at = _timestamps(random.Random(0), 250)
+    pages = _pages(starred_at)
+    assert pages.known_total is None
+    pages.get(1)
+    assert pages.known_total is None
+    assert pages.calls == 1
+    assert pages.total == 250
+    assert pages.known_total == 250
+    assert pages.calls == 2
+
+
+def _fetch_desc(starred_at: list, per_page: int = 100):
+    """Returns a function that serves `starred_at` newest first, like GraphQL."""
+    newest_first = starred_at[::-1]
+
+    def fetch_desc(cursor):
+        start = cursor or 0
+        end = start + per_page
+        return newest_first[start:end], end if end < len(newest_first) else None
+
+    return fetch_desc
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_count_descending(seed):
+    rng = random.Random(seed)
+    starred_at = _timestamps(rng, rng.choice([0, 1, 100, rng.randint(0, 5000)]))
+    boundaries = _boundaries(rng, starred_at)[: rng.randint(1, 4)]
+    stars_after, calls = star_search.count_descending(
+        _fetch_desc(starred_at), boundaries
+    )
+    assert stars_after == [
+        len(starred_at) - star_search.count_before(starred_at, boundary)
+        for boundary in boundaries
+    ]
+    # Stops on the first page that reaches past the earliest boundary.
+    needed = max(stars_after) // 100 + 1
+    assert calls == min(needed, max(1, math.ceil(len(starred_at) / 100)))
@@ -0,0 +1,91 @@
+import math
+import time
+
+import pytest
+
+import star_search
+from stargazer_index import StargazerIndex
+from star_search import Page
+
+
+def _timestamp(i: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1577836800 + i * 3600))
+
+
+class Repo:
+    def __init__(self, num_stars: int):
+        """Stargazers of a repo that can change between searches."""
+        self.starred_at = [_timestamp(i) for i in range(num_stars)]
+        self.calls = 0
+        self.fail_after = None  # number of calls after which fetching fails
+
+    def fetch_many(self, requests):
+        results = []
+        for page, per_page in requests:
+            if self.fail_after is not None and self.calls >= self.fail_after:
+                raise RuntimeError("Connection lost")
+            self.calls += 1
+            num_pages = max(1, math.ceil(len(self.starred_at) / per_page))
+            last_page = num_pages if page < num_pages else 0
+            starred_at = self.starred_at[(page - 1) * per_page : page * per_page]
+            results.append(Page(starred_at, last_page))
+        return results
+
+
+BOUNDARY = _timestamp(1234)
+
+
+def _search(index: StargazerIndex, repo: Repo) -> tuple:
+    """Searches like `_query_repo`, returns stars before `BOUNDARY` and total."""
+    pages = index.load_pages("a/b", repo.fetch_many)
+    result = star_search.binary_search(pages, BOUNDARY), pages.total
+    index.save("a/b", pages)
+    return result
+
+
+def test_repeated_search_uses_index(tmp_path):
+    index = StargazerIndex(str(tmp_path))
+    repo = Repo(2500)
+    assert _search(index, repo) == (1234, 2500)
+    calls = repo.calls
+    assert _search(index, repo) == (1234, 2500)
+    assert repo.calls == calls
+
+
+@pytest.mark.parametrize("new_stars", [1, 50, 100, 333])
+def test_tail_is_refreshed(tmp_path, new_stars):
+    index = StargazerIndex(str(tmp_path), max_age=0)
+    repo = Repo(2550)
+    assert _search(index, repo) == (1234, 2550)
+    repo.starred_at += [_timestamp(10000 + i) for i in range(new_stars)]
+    calls = repo.calls
+    # Loading refetches only the old last page, which links to the new last page.
+    pages = index.load_pages("a/b", repo.fetch_many)
+    assert repo.calls - calls == 1
+    assert pages.num_pages == math.ceil((2550 + new_stars) / 100)
+    assert _search(index, repo) == (1234, 2550 + new_stars)
+
+
+def test_index_is_dropped_when_stars_are_removed(tmp_path, capsys):
+    index = StargazerIndex(str(tmp_path), max_age=0)
+    repo = Repo(2550)
+    assert _search(index, repo) == (1234, 2550)
+    del repo.starred_at[10]
+    assert _search(index, repo) == (1233, 2549)
+    assert "dropping index" in capsys.readouterr().out
+
+
+def test_interrupted_search_continues(tmp_path):
+    index = StargazerIndex(str(tmp_path))
+    repo = Repo(25000)
+    uninterrupted = Repo(25000)
+    _search(StargazerIndex(str(tmp_path / "other")), uninterrupted)
+
+    repo.fail_after = 4
+    with pytest.raises(RuntimeError):
+        _search(index, repo)
+    repo.fail_after = None
+    assert _search(index, repo) == (1234, 25000)
+    # Pages from before the interruption are checkpointed, so they aren't fetched
+    # again.
+    assert repo.calls == uninterrupted.calls
@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+import tokens
+from tokens import NoTokenAvailableError, TokenScheduler
+
+
+class Clock:
+    """Stands in for the `time` module, so tests can move time forward."""
+
+    strftime = staticmethod(time.strftime)
+    localtime = staticmethod(time.localtime)
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tokens, "time", clock)
+    return clock
+
+
+def _headers(remaining: int, reset: float, resource: str = "core") -> dict:
+    return {
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Limit": "5000",
+        "X-RateLimit-Reset": str(reset),
+        "X-RateLimit-Resource": resource,
+    }
+
+
+def test_no_tokens():
+    assert TokenScheduler([]).acquire() is None
+
+
+def test_acquire_spreads_calls_over_tokens(clock):
+    scheduler = TokenScheduler(["a", "b"])
+    # Calls are counted right away, so concurrent requests alternate.
+    assert sorted(scheduler.acquire() for _ in range(4)) == ["a", "a", "b", "b"]
+    scheduler.update("a", "core", _headers(100, clock.now + 60))
+    assert [scheduler.acquire() for _ in range(3)] == ["b", "b", "b"]
+
+
+def test_exhausted_token_is_parked_until_reset(clock):
+    scheduler = TokenScheduler(["a", "b"])
+    scheduler.update("a", "core", _headers(0, clock.now + 60))
+    assert scheduler.acquire() == "b"
+    assert scheduler.usage()[0]["parked"]
+
+    scheduler.update("b", "core", _headers(0, clock.now + 30))
+    with pytest.raises(NoTokenAvailableError) as e:
+        scheduler.acquire()
+    assert e.value.reset == clock.now + 30
+
+    # After the reset, the token starts from the full limit again.
+    clock.now += 31
+    assert scheduler.acquire() == "b"
+    assert scheduler.usage()[1]["remaining"] == 4999
+
+
+def test_resources_are_scheduled_separately(clock):
+    scheduler = TokenScheduler(["a"])
+    scheduler.update("a", "core", _headers(0, clock.now + 60, resource="graphql"))
+    assert scheduler.acquire("core") == "a"
+    with pytest.raises(NoTokenAvailableError):
+        scheduler.acquire("graphql")
+
+
+def test_park_for_secondary_rate_limit(clock):
+    scheduler = TokenScheduler(["a", "b"])
+    scheduler.park("a", "core", 10)
+    assert [scheduler.acquire() for _ in range(3)] == ["b", "b", "b"]
+    clock.now += 11
+    assert scheduler.acquire() == "a"
+    scheduler.park(None, "core", 10)  # unauthenticated requests are ignored
+
+
+def test_capacity(clock):
+    scheduler = TokenScheduler(["a", "b"])
+    scheduler.set_quota("a", "core", 0, 5000, clock.now + 60)
+    scheduler.set_quota("b", "core", 1000, 5000, clock.now + 120)
+    capacity = scheduler.capacity("core")
+    assert capacity["remaining"] == 1000
+    assert capacity["limit"] == 10000
+    assert capacity["reset"] == clock.now + 60
+    assert capacity["available"] == 1
+    assert capacity["observed"] == clock.now
+
+    # Quotas that were reset count with their full limit.
+    clock.now += 61
+    capacity = scheduler.capacity("core")
+    assert capacity["remaining"] == 6000
+    assert capacity["available"] == 2